@@ -0,0 +1,68 @@
+import sys
+
+CNAE_KEY = "cnae:descricoes"
+TIPOS_ATIVIDADE = ("atividade_principal", "atividade_secundaria")
+
+# Cópia local da tabela de CNAE's do Redis. As descrições praticamente
+# nunca mudam, então só códigos desconhecidos são buscados novamente.
+CNAE_DESCRICOES: dict[str, str] = {}
+
+
+def codigo_cnae(cnae: str | dict) -> str:
+    """Extrai o código de um CNAE compacto ("1041400") ou legado ({codigo: descricao})"""
+    if isinstance(cnae, dict):
+        return next(iter(cnae))
+    return cnae
+
+
+async def carregar_descricoes(redis_client, codigos: set[str]):
+    """Busca no Redis as descrições dos códigos que ainda não estão em memória"""
+    faltantes = [codigo for codigo in codigos if codigo not in CNAE_DESCRICOES]
+    if not faltantes:
+        return
+
+    descricoes = await redis_client.hmget(CNAE_KEY, faltantes)
+    for codigo, descricao in zip(faltantes, descricoes):
+        if descricao is not None:
+            CNAE_DESCRICOES[codigo] = sys.intern(descricao)
+
+
+async def formatar_atividades(redis_client, result: dict, compacto: bool) -> dict:
+    """
+    Converte as atividades econômicas de um resultado para o formato pedido.
+
+    Args:
+        redis_client: Cliente do Redis com a tabela de CNAE's
+        result: Resultado da tarefa, com CNAE's compactos ou legados
+        compacto: Se True, retorna apenas os códigos; senão, {codigo: descricao}.
+            Códigos sem descrição na tabela saem com descrição None.
+    Returns:
+        Resultado com as atividades econômicas no formato pedido
+    """
+    atividades = result.get("atividade_economica")
+    if not atividades:
+        return result
+
+    codigos = {
+        tipo: [codigo_cnae(cnae) for cnae in atividades.get(tipo, [])]
+        for tipo in TIPOS_ATIVIDADE
+    }
+
+    if not compacto:
+        # Descrições já presentes no formato legado dispensam a consulta
+        for tipo in TIPOS_ATIVIDADE:
+            for cnae in atividades.get(tipo, []):
+                if isinstance(cnae, dict):
+                    CNAE_DESCRICOES.setdefault(*next(iter(cnae.items())))
+
+        todos = {c for lista in codigos.values() for c in lista}
+        await carregar_descricoes(redis_client, todos)
+        faltantes = todos - CNAE_DESCRICOES.keys()
+        if faltantes:
+            print(f"FastAPI - CNAE's sem descrição no Redis: {sorted(faltantes)}")
+        codigos = {
+            tipo: [{codigo: CNAE_DESCRICOES.get(codigo)} for codigo in lista]
+            for tipo, lista in codigos.items()
+        }
+
+    return {**result, "atividade_economica": codigos}
@@ -1,19 +1,40 @@
 import json
 import os
 import time
-import uuid
+from typing import Literal
 
 import aio_pika
 import redis
-from fastapi import FastAPI, HTTPException, Request, status
+from fastapi import FastAPI, HTTPException, Query, Request, status
 from fastapi.concurrency import asynccontextmanager
+from fastapi.responses import JSONResponse
 from redis import asyncio as aioredis
 
+from app.cnae import CNAE_KEY, formatar_atividades
 from app.models import ScrapeRequest, TaskResponse, TaskStatus
+from app.tasks import (
+    ESTADOS_FINAIS,
+    STATS_KEY,
+    aguardar_conclusao,
+    buscar_ou_criar_tarefa,
+    cancelar_tarefa,
+    clean_cnpj,
+    criar_tarefa,
+    expirar_tarefa,
+    tarefa_vencida,
+)
+from app.transport import QUEUE_BACKEND, create_transport
+from app.warmer import (
+    CACHE_STATS_KEY,
+    WARMER_ENABLED,
+    CacheWarmer,
+    acerto_aquecido,
+    registrar_consulta,
+    registrar_popularidade,
+    taxas_de_acerto,
+)
 
-RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-QUEUE_NAME = "scrape_tasks"
 
 
 @asynccontextmanager
@@ -21,22 +42,6 @@ async def lifespan(app: FastAPI):
     """Gerenciador de contexto para inicialização e finalização da API"""
     retry_interval = 3
 
-    for _ in range(10):
-        try:
-            print("FastAPI - conectando ao RabbitMQ... ")
-            app.state.rabbit_connection = await aio_pika.connect_robust(
-                host=RABBITMQ_HOST, login="user", password="password"
-            )
-            app.state.rabbit_channel = await app.state.rabbit_connection.channel()
-            await app.state.rabbit_channel.declare_queue(QUEUE_NAME, durable=True)
-            print("FastAPI - conectado ao RabbitMQ.")
-            break
-        except aio_pika.exceptions.AMQPConnectionError as e:
-            print(
-                f"FastAPI - erro ao conectar ao RabbitMQ: {e}, tentando novamente em {retry_interval}s..."
-            )
-            time.sleep(retry_interval)
-
     for _ in range(10):
         try:
             print("FastAPI - conectando ao Redis...")
@@ -53,12 +58,21 @@ async def lifespan(app: FastAPI):
             )
             time.sleep(retry_interval)
 
+    print(f"FastAPI - utilizando a fila {QUEUE_BACKEND}")
+    app.state.transport = await create_transport(QUEUE_BACKEND, app.state.redis)
+    await app.state.transport.connect()
+
+    app.state.warmer = CacheWarmer(app.state.redis, app.state.transport)
+    if WARMER_ENABLED:
+        print("FastAPI - aquecimento do cache ligado")
+        await app.state.warmer.start()
+
     yield
 
     try:
         print("FastAPI - finalizando conexões...")
-        await app.state.rabbit_channel.close()
-        await app.state.rabbit_connection.close()
+        await app.state.warmer.stop()
+        await app.state.transport.close()
         await app.state.redis.close()
         print("FastAPI - conexões finalizadas")
     except aio_pika.exceptions.AMQPConnectionError as e:
@@ -91,31 +105,18 @@ async def read_root():
 async def create_scrape_task(
     request: ScrapeRequest,
 ):
-    """Endpoint para iniciar o processo de scraping"""
-    try:
-        task_id = str(uuid.uuid4())
+    """
+    Endpoint para iniciar o processo de scraping.
 
-        redis_client = app.state.redis
-        rabbit_connection = app.state.rabbit_connection
-        channel = await rabbit_connection.channel()
-
-        task_data = {
-            "task_id": task_id,
-            "cnpj": request.cnpj,
-            "status": "pending",
-            "created_at": time.time(),
-        }
-        await redis_client.set(f"task:{task_id}", json.dumps(task_data), ex=3600)
-
-        message = {"task_id": task_id, "cnpj": request.cnpj}
-
-        await channel.default_exchange.publish(
-            aio_pika.Message(
-                body=json.dumps(message).encode(),
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-            ),
-            routing_key=QUEUE_NAME,
+    A tarefa expira no `timeout` informado pelo cliente ou, no máximo, junto
+    com o seu registro no Redis; depois disso os workers a descartam.
+    """
+    try:
+        await registrar_popularidade(app.state.redis, request.cnpj)
+        task_data = await criar_tarefa(
+            app.state.redis, app.state.transport, request.cnpj, request.timeout
         )
+        task_id = task_data["task_id"]
 
         return TaskResponse(
             task_id=task_id,
@@ -134,8 +135,17 @@ async def create_scrape_task(
     response_model=TaskStatus,
     summary="Obter resultados do scraping",
 )
-async def get_task_result(request: Request, task_id: str):
-    """Endpoint para obter os resultados do scraping"""
+async def get_task_result(
+    request: Request,
+    task_id: str,
+    formato: Literal["completo", "compacto"] = "completo",
+):
+    """
+    Endpoint para obter os resultados do scraping.
+
+    No formato compacto as atividades econômicas trazem apenas os códigos
+    CNAE, cujas descrições ficam disponíveis em /cnaes.
+    """
     try:
         redis_client = request.app.state.redis
 
@@ -147,7 +157,147 @@ async def get_task_result(request: Request, task_id: str):
             )
 
         task_data = json.loads(task_data_json)
+        if tarefa_vencida(task_data):
+            task_data = await expirar_tarefa(redis_client, task_id) or task_data
+
+        if task_data.get("status") == "completed" and task_data.get("result"):
+            task_data["result"] = await formatar_atividades(
+                redis_client, task_data["result"], formato == "compacto"
+            )
         return task_data
     except redis.exceptions.RedisError as e:
         print(f"FastAPI - Erro no /results/{task_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao consultar a tarefa {e}")
+
+
+@app.get(
+    "/cnpj/{cnpj}",
+    response_model=TaskStatus,
+    responses={status.HTTP_202_ACCEPTED: {"model": TaskResponse}},
+    summary="Consultar CNPJ com espera limitada",
+)
+async def lookup_cnpj(
+    request: Request,
+    cnpj: str,
+    timeout: float = Query(default=10, ge=0, le=60),
+    formato: Literal["completo", "compacto"] = "completo",
+):
+    """
+    Endpoint de consulta em uma única requisição. Serve o resultado recente
+    do CNPJ se houver; senão cria a tarefa (ou aproveita a que já está em
+    andamento) e aguarda sua conclusão por até `timeout` segundos. Tarefas
+    finalizadas (inclusive expiradas ou canceladas) são retornadas com seu
+    status; se o prazo acabar, responde 202 com o task_id para consulta
+    em /results.
+    """
+    # Entradas sem 14 dígitos cairiam todas na mesma chave cnpj: vazia
+    if len(clean_cnpj(cnpj)) != 14:
+        raise HTTPException(
+            status_code=422, detail="CNPJ inválido: são esperados 14 dígitos"
+        )
+
+    try:
+        redis_client = request.app.state.redis
+
+        await registrar_popularidade(redis_client, cnpj)
+        task_data, criada = await buscar_ou_criar_tarefa(
+            redis_client, request.app.state.transport, cnpj
+        )
+        task_id = task_data["task_id"]
+
+        if criada:
+            await registrar_consulta(redis_client, "falhas")
+        elif task_data["status"] != "completed":
+            await registrar_consulta(redis_client, "juncoes")
+        else:
+            await registrar_consulta(redis_client, "acertos")
+            if acerto_aquecido(task_data):
+                await registrar_consulta(redis_client, "acertos_aquecidos")
+
+        if task_data["status"] != "completed":
+            task_data = await aguardar_conclusao(redis_client, task_id, timeout)
+
+        if not task_data or task_data["status"] not in ESTADOS_FINAIS:
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content=TaskResponse(
+                    task_id=task_id,
+                    status=task_data["status"] if task_data else "pending",
+                    message=f"Consulta em andamento, acompanhe em /results/{task_id}",
+                ).model_dump(),
+            )
+
+        if task_data["status"] == "completed" and task_data.get("result"):
+            task_data["result"] = await formatar_atividades(
+                redis_client, task_data["result"], formato == "compacto"
+            )
+        return task_data
+    except redis.exceptions.RedisError as e:
+        print(f"FastAPI - Erro no /cnpj/{cnpj}: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar o CNPJ {e}")
+
+
+@app.delete(
+    "/results/{task_id}",
+    response_model=TaskResponse,
+    summary="Cancelar tarefa de scraping",
+)
+async def cancel_task(request: Request, task_id: str):
+    """
+    Endpoint para cancelar uma tarefa ainda não finalizada. Workers
+    descartam tarefas canceladas antes de consultar o Sintegra.
+    """
+    try:
+        redis_client = request.app.state.redis
+
+        task_data = await cancelar_tarefa(redis_client, task_id)
+
+        if not task_data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Tarefa não encontrada"
+            )
+
+        if task_data["status"] != "cancelled":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Tarefa já finalizada com status {task_data['status']}",
+            )
+
+        return TaskResponse(
+            task_id=task_id, status="cancelled", message="Tarefa cancelada"
+        )
+    except redis.exceptions.RedisError as e:
+        print(f"FastAPI - Erro no DELETE /results/{task_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao cancelar a tarefa {e}")
+
+
+@app.get("/stats", summary="Contadores dos workers e do cache")
+async def get_stats(request: Request) -> dict[str, dict[str, float]]:
+    """
+    Endpoint com os contadores de tarefas descartadas pelos workers e de
+    acertos do cache em /cnpj/{cnpj}, incluindo o ganho do aquecimento.
+    """
+    try:
+        redis_client = request.app.state.redis
+        worker_stats = await redis_client.hgetall(STATS_KEY)
+        cache_stats = await redis_client.hgetall(CACHE_STATS_KEY)
+        cache_stats = {key: int(value) for key, value in cache_stats.items()}
+        return {
+            "worker": {key: int(value) for key, value in worker_stats.items()},
+            "cache": {**cache_stats, **taxas_de_acerto(cache_stats)},
+        }
+    except redis.exceptions.RedisError as e:
+        print(f"FastAPI - Erro no /stats: {e}")
+        raise HTTPException(
+            status_code=500, detail=f"Erro ao consultar os contadores {e}"
+        )
+
+
+@app.get("/cnaes", summary="Tabela de descrições de CNAE")
+async def get_cnaes(request: Request) -> dict[str, str]:
+    """Endpoint com as descrições dos CNAE's já vistos, para o formato compacto"""
+    try:
+        return await request.app.state.redis.hgetall(CNAE_KEY)
+    except redis.exceptions.RedisError as e:
+        print(f"FastAPI - Erro no /cnaes: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar os CNAE's {e}")
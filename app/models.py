@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class TaskStatus(BaseModel):
@@ -6,6 +6,8 @@ class TaskStatus(BaseModel):
     status: str
     result: dict | None = None
     created_at: float | None = None
+    completed_at: float | None = None
+    deadline: float | None = None
 
 
 class TaskResponse(BaseModel):
@@ -16,3 +18,5 @@ class TaskResponse(BaseModel):
 
 class ScrapeRequest(BaseModel):
     cnpj: str
+    # Segundos que o cliente aceita esperar; depois disso a tarefa é descartada
+    timeout: float | None = Field(default=None, gt=0)
@@ -0,0 +1,251 @@
+import json
+import os
+import time
+import uuid
+
+from redis.exceptions import WatchError
+
+TASK_TTL = 3600
+# Idade máxima de um resultado para ser servido direto por /cnpj/{cnpj}
+CNPJ_CACHE_MAX_AGE = float(os.getenv("CNPJ_CACHE_MAX_AGE", "3600"))
+
+ESTADOS_EM_ANDAMENTO = ("pending", "processing")
+ESTADOS_FINAIS = ("completed", "failed", "expired", "cancelled")
+
+# Contadores de trabalho descartado, compartilhados com os workers
+STATS_KEY = "stats:worker"
+
+# Troca o índice cnpj:{cnpj} para a nova tarefa somente se ele ainda aponta
+# para a tarefa que foi lida (ou não existe). Retorna a tarefa vencedora.
+CLAIM_SCRIPT = """
+local atual = redis.call('GET', KEYS[1])
+if atual == false then atual = '' end
+if atual == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return ARGV[2]
+end
+return atual
+"""
+
+
+def clean_cnpj(cnpj: str) -> str:
+    return "".join(filter(str.isdigit, cnpj))
+
+
+def cnpj_key(cnpj: str) -> str:
+    return f"cnpj:{clean_cnpj(cnpj)}"
+
+
+def task_done_channel(task_id: str) -> str:
+    return f"task_done:{task_id}"
+
+
+def nova_tarefa(
+    cnpj: str, timeout: float | None = None, substitui: dict | None = None
+) -> dict:
+    """
+    Monta o registro de uma nova tarefa. Ela expira no `timeout` informado
+    ou, no máximo, junto com o seu registro no Redis; depois disso os
+    workers a descartam.
+
+    Tarefas de aquecimento (`substitui` é o resultado atual do CNPJ) guardam
+    quando esse resultado foi concluído, para medir o ganho do aquecimento.
+    """
+    created_at = time.time()
+    task_data = {
+        "task_id": str(uuid.uuid4()),
+        "cnpj": cnpj,
+        "status": "pending",
+        "created_at": created_at,
+        "deadline": created_at + min(timeout or TASK_TTL, TASK_TTL),
+    }
+    if substitui is not None:
+        task_data["aquecida"] = True
+        task_data["substitui_completed_at"] = substitui.get("completed_at")
+    return task_data
+
+
+async def publicar_tarefa(transport, task_data: dict):
+    message = {
+        "task_id": task_data["task_id"],
+        "cnpj": task_data["cnpj"],
+        "deadline": task_data["deadline"],
+    }
+    await transport.publish(message, ttl=task_data["deadline"] - time.time())
+
+
+async def criar_tarefa(
+    redis_client,
+    transport,
+    cnpj: str,
+    timeout: float | None = None,
+    substitui: dict | None = None,
+) -> dict:
+    """
+    Registra a tarefa no Redis e a publica na fila.
+
+    Tarefas de aquecimento (que substituem um resultado) não entram no índice
+    do CNPJ, para que o resultado atual continue sendo servido até o worker
+    concluir a atualização.
+    """
+    task_data = nova_tarefa(cnpj, timeout, substitui)
+    task_id = task_data["task_id"]
+    await redis_client.set(f"task:{task_id}", json.dumps(task_data), ex=TASK_TTL)
+    if substitui is None:
+        await redis_client.set(cnpj_key(cnpj), task_id, ex=TASK_TTL)
+    await publicar_tarefa(transport, task_data)
+    return task_data
+
+
+async def buscar_tarefa(redis_client, task_id: str) -> dict | None:
+    task_data_json = await redis_client.get(f"task:{task_id}")
+    return json.loads(task_data_json) if task_data_json else None
+
+
+def tarefa_vencida(task_data: dict) -> bool:
+    """
+    Tarefa ainda em andamento cujo deadline já passou. Os workers a descartam,
+    e o RabbitMQ pode até removê-la da fila sem que nenhum worker a veja.
+    """
+    deadline = task_data.get("deadline")
+    return (
+        task_data["status"] in ESTADOS_EM_ANDAMENTO
+        and deadline is not None
+        and deadline <= time.time()
+    )
+
+
+def tarefa_aproveitavel(task_data: dict | None) -> bool:
+    """Tarefa em andamento dentro do deadline ou concluída recentemente o bastante"""
+    if not task_data:
+        return False
+    if task_data["status"] in ESTADOS_EM_ANDAMENTO:
+        # Juntar-se a uma tarefa vencida só faria o cliente esperar por um
+        # resultado que não virá
+        return not tarefa_vencida(task_data)
+    completed_at = task_data.get("completed_at") or 0
+    return (
+        task_data["status"] == "completed"
+        and time.time() - completed_at <= CNPJ_CACHE_MAX_AGE
+    )
+
+
+async def buscar_ou_criar_tarefa(
+    redis_client, transport, cnpj: str
+) -> tuple[dict, bool]:
+    """
+    Retorna o resultado recente ou a tarefa em andamento do CNPJ, ou cria
+    uma nova tarefa. Requisições simultâneas para o mesmo CNPJ compartilham
+    uma única tarefa.
+
+    Returns:
+        A tarefa e se ela foi criada por esta chamada
+    """
+    key = cnpj_key(cnpj)
+    while True:
+        current_id = await redis_client.get(key) or ""
+        task_data = current_id and await buscar_tarefa(redis_client, current_id)
+        if tarefa_aproveitavel(task_data):
+            return task_data, False
+
+        task_data = nova_tarefa(cnpj)
+        task_id = task_data["task_id"]
+        await redis_client.set(f"task:{task_id}", json.dumps(task_data), ex=TASK_TTL)
+
+        winner = await redis_client.eval(
+            CLAIM_SCRIPT, 1, key, current_id, task_id, TASK_TTL
+        )
+        if winner != task_id:
+            # Outra requisição criou a tarefa primeiro: junta-se a ela
+            await redis_client.delete(f"task:{task_id}")
+            continue
+
+        await publicar_tarefa(transport, task_data)
+        return task_data, True
+
+
+async def _finalizar_em_andamento(
+    redis_client, task_id: str, status: str, contador: str | None = None
+) -> dict | None:
+    """
+    Leva uma tarefa em andamento ao estado final `status` e notifica quem a
+    aguarda. A leitura e a escrita rodam sob WATCH, então a conclusão da
+    tarefa por um worker no meio do caminho nunca é sobrescrita. Se
+    `contador` for informado, ele é incrementado em STATS_KEY na mesma
+    transação.
+
+    Returns:
+        A tarefa após a tentativa, ou None se ela não existe
+    """
+    task_key = f"task:{task_id}"
+    async with redis_client.pipeline() as pipe:
+        while True:
+            try:
+                await pipe.watch(task_key)
+                task_data_json = await pipe.get(task_key)
+                if not task_data_json:
+                    return None
+
+                task_data = json.loads(task_data_json)
+                if task_data["status"] not in ESTADOS_EM_ANDAMENTO:
+                    return task_data
+
+                task_data["status"] = status
+                pipe.multi()
+                pipe.set(task_key, json.dumps(task_data), keepttl=True, xx=True)
+                if contador:
+                    pipe.hincrby(STATS_KEY, contador)
+                # Acorda quem aguarda a tarefa em GET /cnpj/{cnpj}
+                pipe.publish(task_done_channel(task_id), status)
+                await pipe.execute()
+                return task_data
+            except WatchError:
+                continue
+
+
+async def cancelar_tarefa(redis_client, task_id: str) -> dict | None:
+    """
+    Marca a tarefa como cancelada se ela ainda está em andamento.
+
+    Returns:
+        A tarefa após a tentativa de cancelamento, ou None se ela não existe
+    """
+    return await _finalizar_em_andamento(redis_client, task_id, "cancelled")
+
+
+async def expirar_tarefa(redis_client, task_id: str) -> dict | None:
+    """
+    Marca como expirada uma tarefa vencida que nenhum worker descartou (ex.:
+    a mensagem expirou na fila do RabbitMQ), contando-a como descartada.
+
+    Returns:
+        A tarefa após a tentativa, ou None se ela não existe
+    """
+    return await _finalizar_em_andamento(
+        redis_client, task_id, "expired", contador="descartadas_expiradas"
+    )
+
+
+async def aguardar_conclusao(redis_client, task_id: str, timeout: float) -> dict | None:
+    """
+    Aguarda a notificação de conclusão da tarefa por até `timeout` segundos.
+
+    Returns:
+        A tarefa, se ela terminou dentro do prazo; None caso contrário
+    """
+    deadline = time.monotonic() + timeout
+    async with redis_client.pubsub() as pubsub:
+        await pubsub.subscribe(task_done_channel(task_id))
+
+        # A tarefa pode ter terminado antes da inscrição no canal
+        task_data = await buscar_tarefa(redis_client, task_id)
+        while task_data and task_data["status"] not in ESTADOS_FINAIS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                task_data = await buscar_tarefa(redis_client, task_id)
+        return task_data
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+from typing import Callable
+
+import aio_pika
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "rabbitmq")
+QUEUE_NAME = "scrape_tasks"
+
+STREAM_GROUP = "scrape_workers"
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+INPROCESS_WORKERS = int(os.getenv("INPROCESS_WORKERS", "4"))
+
+
+class RabbitMQPublisher:
+    """Publica tarefas em uma fila durável do RabbitMQ"""
+
+    def __init__(self, host: str = RABBITMQ_HOST, queue: str = QUEUE_NAME):
+        self.host = host
+        self.queue = queue
+        self.connection = None
+        self.channel = None
+
+    async def connect(self):
+        retry_interval = 3
+        for _ in range(10):
+            try:
+                print("FastAPI - conectando ao RabbitMQ... ")
+                self.connection = await aio_pika.connect_robust(
+                    host=self.host, login="user", password="password"
+                )
+                self.channel = await self.connection.channel()
+                await self.channel.declare_queue(self.queue, durable=True)
+                print("FastAPI - conectado ao RabbitMQ.")
+                return
+            except aio_pika.exceptions.AMQPConnectionError as e:
+                print(
+                    f"FastAPI - erro ao conectar ao RabbitMQ: {e}, tentando novamente em {retry_interval}s..."
+                )
+                await asyncio.sleep(retry_interval)
+        raise Exception("Não foi possível se conectar ao RabbitMQ.")
+
+    async def publish(self, message: dict, ttl: float | None = None):
+        await self.channel.default_exchange.publish(
+            aio_pika.Message(
+                body=json.dumps(message).encode(),
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                expiration=ttl,
+            ),
+            routing_key=self.queue,
+        )
+
+    async def depth(self) -> int:
+        """Mensagens aguardando consumo na fila"""
+        # robust=False: a declaração passiva só lê a contagem; uma fila robusta
+        # ficaria registrada no canal e seria redeclarada a cada reconexão
+        queue = await self.channel.declare_queue(self.queue, passive=True, robust=False)
+        return queue.declaration_result.message_count
+
+    async def close(self):
+        await self.channel.close()
+        await self.connection.close()
+
+
+class RedisStreamsPublisher:
+    """Publica tarefas em um Redis Stream consumido por um consumer group"""
+
+    def __init__(self, redis_client: aioredis.Redis, stream: str = QUEUE_NAME):
+        self.redis = redis_client
+        self.stream = stream
+
+    async def connect(self):
+        pass
+
+    async def publish(self, message: dict, ttl: float | None = None):
+        # Streams não expiram entradas individuais; o worker confere o deadline
+        await self.redis.xadd(
+            self.stream,
+            {"payload": json.dumps(message)},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    async def depth(self) -> int:
+        """Mensagens do stream ainda não entregues ao consumer group"""
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except ResponseError:
+            # O stream ainda não existe
+            return 0
+        for group in groups:
+            if group["name"] == STREAM_GROUP and group.get("lag") is not None:
+                return group["lag"]
+        return await self.redis.xlen(self.stream)
+
+    async def close(self):
+        pass
+
+
+class InProcessTransport:
+    """
+    Fila em memória (asyncio.Queue) consumida dentro do próprio processo
+    da API, para implantações de um único nó sem broker.
+
+    O handler é síncrono (o mesmo do worker) e roda em threads, então
+    tarefas pendentes na fila são perdidas se o processo for encerrado.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], bool],
+        workers: int = INPROCESS_WORKERS,
+        maxsize: int = 0,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.tasks: list[asyncio.Task] = []
+
+    async def connect(self):
+        self.tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+
+    async def publish(self, message: dict, ttl: float | None = None):
+        await self.queue.put(message)
+
+    async def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def _consume(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await asyncio.to_thread(self.handler, message)
+            except Exception as e:
+                print(f"FastAPI - erro ao processar mensagem {message}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+async def create_transport(backend: str, redis_client: aioredis.Redis):
+    """Instancia o transporte de fila configurado em QUEUE_BACKEND"""
+    if backend == "rabbitmq":
+        return RabbitMQPublisher()
+    if backend == "redis":
+        return RedisStreamsPublisher(redis_client)
+    if backend == "memory":
+        # Importado aqui para que a API só dependa do worker quando
+        # ele roda no mesmo processo
+        from worker.consumer import get_redis_connection, handle_message
+
+        # A conexão síncrona do worker tenta reconectar com time.sleep, então
+        # roda fora do event loop
+        sync_redis = await asyncio.to_thread(get_redis_connection)
+        return InProcessTransport(lambda message: handle_message(message, sync_redis))
+    raise ValueError(f"Backend de fila não suportado: {backend}")
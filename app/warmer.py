@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+
+from app.tasks import (
+    CNPJ_CACHE_MAX_AGE,
+    buscar_tarefa,
+    clean_cnpj,
+    cnpj_key,
+    criar_tarefa,
+)
+
+POPULARITY_KEY = "popularidade:cnpj"
+# Marca da última redução das contagens, compartilhada entre as réplicas da API
+POPULARITY_DECAY_KEY = "popularidade:decay"
+CACHE_STATS_KEY = "stats:cache"
+
+# Quantidade de CNPJ's monitorados pelo top-K (memória fixa no Redis)
+POPULARITY_CAPACITY = int(os.getenv("POPULARITY_CAPACITY", "20000"))
+# Intervalo em que as contagens caem pela metade, para acompanhar a demanda recente
+POPULARITY_DECAY_INTERVAL = float(os.getenv("POPULARITY_DECAY_INTERVAL", "3600"))
+
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "false").lower() in ("1", "true", "yes")
+WARMER_TOP_K = int(os.getenv("WARMER_TOP_K", "2000"))
+WARMER_LEAD_TIME = float(os.getenv("WARMER_LEAD_TIME", "300"))
+WARMER_INTERVAL = float(os.getenv("WARMER_INTERVAL", "60"))
+WARMER_MAX_PER_CYCLE = int(os.getenv("WARMER_MAX_PER_CYCLE", "50"))
+# O aquecimento só usa folga: cada ciclo enfileira no máximo o que falta
+# para a fila chegar a este tamanho
+WARMER_MAX_QUEUE_DEPTH = int(os.getenv("WARMER_MAX_QUEUE_DEPTH", "5"))
+
+# Top-K pelo algoritmo Space-Saving: enquanto houver espaço, conta o CNPJ;
+# com o conjunto cheio, um CNPJ novo substitui o menos popular e herda sua
+# contagem + 1, o que garante que os CNPJ's realmente frequentes permaneçam.
+SPACE_SAVING_SCRIPT = """
+if redis.call('ZSCORE', KEYS[1], ARGV[1])
+    or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    return redis.call('ZINCRBY', KEYS[1], 1, ARGV[1])
+end
+local menor = redis.call('ZPOPMIN', KEYS[1])
+local contagem = tonumber(menor[2]) + 1
+redis.call('ZADD', KEYS[1], contagem, ARGV[1])
+return tostring(contagem)
+"""
+
+
+async def registrar_popularidade(redis_client, cnpj: str):
+    """Conta uma consulta do CNPJ no top-K de popularidade"""
+    try:
+        await redis_client.eval(
+            SPACE_SAVING_SCRIPT,
+            1,
+            POPULARITY_KEY,
+            clean_cnpj(cnpj),
+            POPULARITY_CAPACITY,
+        )
+    except Exception as e:
+        print(f"FastAPI - erro ao registrar popularidade do CNPJ {cnpj}: {e}")
+
+
+async def registrar_consulta(redis_client, campo: str):
+    """Incrementa um dos contadores de acerto do cache em stats:cache"""
+    try:
+        await redis_client.hincrby(CACHE_STATS_KEY, campo)
+    except Exception as e:
+        print(f"FastAPI - erro ao incrementar o contador {campo}: {e}")
+
+
+def taxas_de_acerto(stats: dict[str, int]) -> dict[str, float]:
+    """
+    Taxa de acerto das consultas por CNPJ e o ganho atribuído ao aquecimento
+    (acertos que seriam falhas sem a atualização antecipada).
+    """
+    consultas = sum(stats.get(campo, 0) for campo in ("acertos", "juncoes", "falhas"))
+    if not consultas:
+        return {"taxa_acerto": 0.0, "ganho_aquecimento": 0.0}
+    return {
+        "taxa_acerto": stats.get("acertos", 0) / consultas,
+        "ganho_aquecimento": stats.get("acertos_aquecidos", 0) / consultas,
+    }
+
+
+def acerto_aquecido(task_data: dict) -> bool:
+    """
+    Acerto que seria uma falha sem o aquecimento: o resultado aquecido é
+    servido quando o resultado que ele substituiu já teria passado de
+    CNPJ_CACHE_MAX_AGE.
+    """
+    substitui_completed_at = task_data.get("substitui_completed_at")
+    return (
+        bool(task_data.get("aquecida"))
+        and substitui_completed_at is not None
+        and time.time() - substitui_completed_at > CNPJ_CACHE_MAX_AGE
+    )
+
+
+class CacheWarmer:
+    """
+    Reexecuta o scraping dos CNPJ's mais consultados pouco antes de seus
+    resultados expirarem, usando apenas a folga da fila.
+    """
+
+    def __init__(self, redis_client, transport):
+        self.redis = redis_client
+        self.transport = transport
+        self.task = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def run(self):
+        while True:
+            try:
+                await self.ciclo()
+            except Exception as e:
+                print(f"FastAPI - erro no aquecimento do cache: {e}")
+            await asyncio.sleep(WARMER_INTERVAL)
+
+    async def decair_popularidade(self):
+        """
+        Reduz as contagens pela metade uma vez por POPULARITY_DECAY_INTERVAL
+        em toda a implantação: só a réplica que cria a marca no Redis reduz.
+        """
+        if not await self.redis.set(
+            POPULARITY_DECAY_KEY,
+            1,
+            nx=True,
+            ex=max(1, int(POPULARITY_DECAY_INTERVAL)),
+        ):
+            return
+        await self.redis.zunionstore(POPULARITY_KEY, {POPULARITY_KEY: 0.5})
+
+    async def resultado_a_aquecer(self, cnpj: str) -> dict | None:
+        """Resultado concluído do CNPJ que sai da janela de frescor em breve"""
+        task_id = await self.redis.get(cnpj_key(cnpj))
+        task_data = task_id and await buscar_tarefa(self.redis, task_id)
+        if not task_data or task_data["status"] != "completed":
+            return None
+        idade = time.time() - (task_data.get("completed_at") or 0)
+        if idade < CNPJ_CACHE_MAX_AGE - WARMER_LEAD_TIME:
+            return None
+        return task_data
+
+    async def ciclo(self) -> int:
+        """
+        Executa um ciclo de aquecimento.
+
+        Returns:
+            Quantidade de tarefas de aquecimento enfileiradas
+        """
+        await self.decair_popularidade()
+
+        # Nunca enfileira mais do que a folga da fila
+        depth = await self.transport.depth()
+        limite = min(WARMER_MAX_PER_CYCLE, WARMER_MAX_QUEUE_DEPTH - depth)
+        if limite <= 0:
+            print(f"FastAPI - aquecimento pulado, {depth} tarefas na fila")
+            return 0
+
+        enfileiradas = 0
+        for cnpj in await self.redis.zrevrange(POPULARITY_KEY, 0, WARMER_TOP_K - 1):
+            if enfileiradas >= limite:
+                break
+            resultado = await self.resultado_a_aquecer(cnpj)
+            if resultado is None:
+                continue
+            # Uma única atualização por CNPJ dentro da janela de antecedência
+            if not await self.redis.set(
+                f"aquecendo:{cnpj}", 1, nx=True, ex=int(WARMER_LEAD_TIME)
+            ):
+                continue
+
+            await criar_tarefa(self.redis, self.transport, cnpj, substitui=resultado)
+            enfileiradas += 1
+
+        if enfileiradas:
+            await self.redis.hincrby(CACHE_STATS_KEY, "aquecimentos", enfileiradas)
+            stats = await self.redis.hgetall(CACHE_STATS_KEY)
+            taxas = taxas_de_acerto({k: int(v) for k, v in stats.items()})
+            print(
+                f"FastAPI - {enfileiradas} CNPJ's aquecidos. Taxa de acerto: "
+                f"{taxas['taxa_acerto']:.1%}, ganho do aquecimento: "
+                f"{taxas['ganho_aquecimento']:.1%}"
+            )
+        return enfileiradas
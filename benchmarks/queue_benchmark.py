@@ -0,0 +1,157 @@
+"""
+Benchmark de latência enqueue→dequeue e vazão dos transportes de fila.
+
+Publica as mensagens pelo lado da API (assíncrono) e as consome pelo lado
+do worker, como no sistema real. Backends cujo servidor não está acessível
+são ignorados.
+
+Uso:
+    python -m benchmarks.queue_benchmark --messages 2000 --backends memory redis
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+import redis
+from redis import asyncio as aioredis
+
+from app.transport import InProcessTransport, RabbitMQPublisher, RedisStreamsPublisher
+from worker.transport import RabbitMQTransport, RedisStreamsTransport
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+BENCH_QUEUE = "scrape_tasks_bench"
+
+
+class Recorder:
+    """Registra a latência de cada mensagem e sinaliza quando todas chegaram"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.latencies = []
+        self.finished_at = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, message: dict) -> bool:
+        now = time.perf_counter()
+        with self.lock:
+            self.latencies.append(now - message["enqueued_at"])
+            if len(self.latencies) >= self.total:
+                self.finished_at = now
+                self.done.set()
+        return True
+
+
+async def publish_all(publisher, total: int) -> float:
+    started_at = time.perf_counter()
+    for i in range(total):
+        await publisher.publish(
+            {"task_id": str(i), "cnpj": "bench", "enqueued_at": time.perf_counter()}
+        )
+    return started_at
+
+
+async def bench_memory(total: int) -> Recorder:
+    recorder = Recorder(total)
+    transport = InProcessTransport(recorder, workers=1)
+    await transport.connect()
+    recorder.started_at = await publish_all(transport, total)
+    await asyncio.to_thread(recorder.done.wait)
+    await transport.close()
+    return recorder
+
+
+async def bench_consumer_thread(publisher, consumer, total: int) -> Recorder:
+    recorder = Recorder(total)
+
+    def handler(message):
+        recorder(message)
+        if recorder.done.is_set():
+            consumer.stop()
+        return True
+
+    thread = threading.Thread(target=consumer.consume, args=(handler,), daemon=True)
+    thread.start()
+
+    await publisher.connect()
+    recorder.started_at = await publish_all(publisher, total)
+    await asyncio.to_thread(recorder.done.wait)
+    await asyncio.to_thread(thread.join)
+    await publisher.close()
+    return recorder
+
+
+async def bench_rabbitmq(total: int) -> Recorder:
+    consumer = RabbitMQTransport(queue=BENCH_QUEUE)
+    consumer.connect()
+    consumer.channel.queue_purge(BENCH_QUEUE)
+    try:
+        return await bench_consumer_thread(
+            RabbitMQPublisher(queue=BENCH_QUEUE), consumer, total
+        )
+    finally:
+        consumer.channel.queue_delete(BENCH_QUEUE)
+        consumer.close()
+
+
+async def bench_redis(total: int) -> Recorder:
+    sync_redis = redis.Redis(host=REDIS_HOST, decode_responses=True)
+    async_redis = aioredis.Redis(host=REDIS_HOST, decode_responses=True)
+    sync_redis.delete(BENCH_QUEUE)
+    consumer = RedisStreamsTransport(sync_redis, stream=BENCH_QUEUE)
+    consumer.connect()
+    try:
+        return await bench_consumer_thread(
+            RedisStreamsPublisher(async_redis, stream=BENCH_QUEUE),
+            consumer,
+            total,
+        )
+    finally:
+        sync_redis.delete(BENCH_QUEUE)
+        await async_redis.aclose()
+
+
+BACKENDS = {
+    "memory": bench_memory,
+    "rabbitmq": bench_rabbitmq,
+    "redis": bench_redis,
+}
+
+
+def report(backend: str, recorder: Recorder):
+    latencies = sorted(recorder.latencies)
+    elapsed = recorder.finished_at - recorder.started_at
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(
+        f"{backend:<10} {len(latencies):>8} {p50:>10.3f} {p99:>10.3f} "
+        f"{len(latencies) / elapsed:>12.0f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument(
+        "--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS)
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'backend':<10} {'msgs':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'msgs/s':>12}"
+    )
+    for backend in args.backends:
+        try:
+            recorder = await BACKENDS[backend](args.messages)
+        except Exception as e:
+            print(f"{backend:<10} ignorado: {e}")
+            continue
+        report(backend, recorder)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
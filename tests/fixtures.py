@@ -0,0 +1,15 @@
+"""HTML de resultado do Sintegra compartilhado entre os testes"""
+
+HTML_RESULTADO = """
+<div class="item">
+    <span class="label_title">CNPJ:</span>
+    <span class="label_text">00.012.377/0001-60</span>
+</div>
+<div class="col box">
+    <div class="box_title">Atividade Econômica</div>
+    <span class="label_text">Atividade Principal</span>
+    <span class="label_text" style="font-weight: normal;">
+    4741500 - Comércio varejista de tintas e materiais para pintura
+    </span>
+</div>
+"""
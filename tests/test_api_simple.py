@@ -181,3 +181,19 @@ class TestAPISimple:
 
         except requests.exceptions.ConnectionError:
             pytest.skip("API não está rodando")
+
+    def test_lookup_cnpj(self):
+        """Teste da consulta síncrona por CNPJ"""
+        try:
+            response = requests.get(
+                f"{self.BASE_URL}/cnpj/{self.TEST_CNPJ}", params={"timeout": 5}
+            )
+            assert response.status_code in [200, 202]
+
+            data = response.json()
+            assert "task_id" in data
+            if response.status_code == 200:
+                assert data["status"] in ["completed", "failed"]
+
+        except requests.exceptions.ConnectionError:
+            pytest.skip("API não está rodando")
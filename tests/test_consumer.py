@@ -0,0 +1,125 @@
+import json
+import time
+from unittest.mock import MagicMock, Mock, patch
+
+import redis
+
+from worker.consumer import handle_message, publicar_cnaes, update_redis
+
+
+def redis_com_tarefa(task_data: dict | None) -> MagicMock:
+    redis_client = MagicMock()
+    task_data_json = json.dumps(task_data) if task_data else None
+    redis_client.get.return_value = task_data_json
+    redis_client.pipeline.return_value.__enter__.return_value.get.return_value = (
+        task_data_json
+    )
+    return redis_client
+
+
+def pipeline_de(redis_client: MagicMock) -> MagicMock:
+    return redis_client.pipeline.return_value.__enter__.return_value
+
+
+class TestDeadlines:
+    """Testes do descarte de tarefas expiradas ou canceladas no worker"""
+
+    @patch("worker.consumer.perform_scraping")
+    def test_tarefa_apos_deadline_descartada(self, mock_scraping):
+        """Tarefas que passaram do deadline não consultam o Sintegra"""
+        redis_client = redis_com_tarefa({"task_id": "a", "status": "pending"})
+        message = {"task_id": "a", "cnpj": "1", "deadline": time.time() - 1}
+
+        assert handle_message(message, redis_client) is True
+
+        mock_scraping.assert_not_called()
+        redis_client.hincrby.assert_called_once_with(
+            "stats:worker", "descartadas_expiradas"
+        )
+        saved = json.loads(pipeline_de(redis_client).set.call_args[0][1])
+        assert saved["status"] == "expired"
+
+    @patch("worker.consumer.perform_scraping")
+    def test_tarefa_cancelada_descartada(self, mock_scraping):
+        """Tarefas canceladas pelo cliente não consultam o Sintegra"""
+        redis_client = redis_com_tarefa({"task_id": "a", "status": "cancelled"})
+        message = {"task_id": "a", "cnpj": "1", "deadline": time.time() + 60}
+
+        assert handle_message(message, redis_client) is True
+
+        mock_scraping.assert_not_called()
+        redis_client.hincrby.assert_called_once_with(
+            "stats:worker", "descartadas_canceladas"
+        )
+
+    @patch("worker.consumer.perform_scraping")
+    def test_tarefa_ja_expirada_pela_api(self, mock_scraping):
+        """Tarefas já expiradas pela API são descartadas sem contar de novo"""
+        redis_client = redis_com_tarefa({"task_id": "a", "status": "expired"})
+        message = {"task_id": "a", "cnpj": "1", "deadline": time.time() - 1}
+
+        assert handle_message(message, redis_client) is True
+
+        mock_scraping.assert_not_called()
+        redis_client.hincrby.assert_not_called()
+        pipeline_de(redis_client).set.assert_not_called()
+
+    @patch("worker.consumer.perform_scraping")
+    def test_tarefa_expirada_no_redis_descartada(self, mock_scraping):
+        """Tarefas sem registro no Redis não são processadas nem recriadas"""
+        redis_client = redis_com_tarefa(None)
+
+        assert handle_message({"task_id": "a", "cnpj": "1"}, redis_client) is True
+
+        mock_scraping.assert_not_called()
+        pipeline_de(redis_client).set.assert_not_called()
+
+    def test_update_redis_nao_recria_registro(self):
+        """update_redis não grava tarefas cujo registro já expirou"""
+        redis_client = redis_com_tarefa(None)
+
+        update_redis(redis_client, "a", "completed", {"cnpj": "1"})
+
+        pipeline_de(redis_client).set.assert_not_called()
+        redis_client.hincrby.assert_called_once_with(
+            "stats:worker", "escritas_orfas_evitadas"
+        )
+
+    def test_update_redis_refaz_apos_cancelamento(self):
+        """Se a tarefa for cancelada entre a leitura e a escrita, nada é gravado"""
+        redis_client = redis_com_tarefa(None)
+        pipe = pipeline_de(redis_client)
+        pipe.get.side_effect = [
+            json.dumps({"task_id": "a", "status": "processing"}),
+            json.dumps({"task_id": "a", "status": "cancelled"}),
+        ]
+        pipe.execute.side_effect = redis.exceptions.WatchError()
+
+        update_redis(redis_client, "a", "completed", {"cnpj": "1"})
+
+        assert pipe.watch.call_count == 2
+        assert pipe.execute.call_count == 1
+        redis_client.publish.assert_not_called()
+
+
+class TestPublicarCnaes:
+    """Testes da publicação das descrições de CNAE"""
+
+    def test_publica_com_hsetnx_a_cada_tarefa(self):
+        """As descrições são regravadas a cada tarefa, sem sobrescrever"""
+        redis_client = Mock()
+        pipe = redis_client.pipeline.return_value
+        scraped_cnpj = Mock()
+        scraped_cnpj.atividade_economica.cnaes.return_value = [
+            Mock(codigo="1041400", descricao="Fabricação de óleos"),
+            Mock(codigo="4930202", descricao=""),
+        ]
+
+        publicar_cnaes(redis_client, scraped_cnpj)
+        publicar_cnaes(redis_client, scraped_cnpj)
+
+        assert pipe.hsetnx.call_count == 2
+        pipe.hsetnx.assert_called_with(
+            "cnae:descricoes", "1041400", "Fabricação de óleos"
+        )
+        assert pipe.execute.call_count == 2
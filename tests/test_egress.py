@@ -0,0 +1,176 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from tests.fixtures import HTML_RESULTADO
+from worker.egress import EgressPool, EgressRoute
+from worker.scraper import perform_scraping
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def stand_in_proxy(status_code: int):
+    """Proxy HTTP local que responde diretamente a toda requisição encaminhada"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = HTML_RESULTADO.encode()
+            self.send_response(status_code)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestEgressPool:
+    """Testes da seleção e pontuação das rotas de saída"""
+
+    def test_prefere_rota_mais_rapida(self):
+        """A rota com menor latência média é escolhida"""
+        clock = FakeClock()
+        lenta = EgressRoute("http://lenta:3128", rate=0, clock=clock)
+        rapida = EgressRoute("http://rapida:3128", rate=0, clock=clock)
+        pool = EgressPool([lenta, rapida], clock=clock, sleep=clock.sleep)
+
+        pool.report(lenta, latency=5.0)
+        pool.report(rapida, latency=0.2)
+
+        assert pool.acquire() is rapida
+
+    def test_erros_pioram_a_pontuacao(self):
+        """Uma rota rápida mas com erros perde para uma estável"""
+        clock = FakeClock()
+        instavel = EgressRoute("http://instavel:3128", rate=0, clock=clock)
+        estavel = EgressRoute("http://estavel:3128", rate=0, clock=clock)
+        pool = EgressPool([instavel, estavel], clock=clock, sleep=clock.sleep)
+
+        pool.report(instavel, latency=0.5)
+        pool.report(estavel, latency=1.0)
+        for _ in range(5):
+            pool.report(instavel, error=True)
+
+        assert pool.acquire() is estavel
+
+    def test_rota_ociosa_volta_a_ser_tentada(self):
+        """Sem limite de taxa, a pontuação de uma rota ociosa volta ao valor inicial"""
+        clock = FakeClock()
+        lenta = EgressRoute("http://lenta:3128", rate=0, clock=clock)
+        media = EgressRoute("http://media:3128", rate=0, clock=clock)
+        pool = EgressPool([lenta, media], clock=clock, sleep=clock.sleep)
+
+        for _ in range(10):
+            pool.report(lenta, latency=10.0)
+        assert pool.acquire() is media
+
+        # A rota média segue em uso, um pouco acima da latência inicial
+        for _ in range(20):
+            clock.now += 60
+            pool.report(media, latency=2.0)
+
+        assert pool.acquire() is lenta
+
+    def test_cooldown_apos_bloqueio(self):
+        """Rotas bloqueadas ficam fora do pool até o fim do cooldown"""
+        clock = FakeClock()
+        route = EgressRoute("direct", rate=0, clock=clock)
+        pool = EgressPool([route], clock=clock, sleep=clock.sleep)
+
+        pool.report(route, blocked=True)
+        with pytest.raises(Exception, match="Nenhuma rota"):
+            pool.acquire(max_wait=10, fallback=False)
+
+        assert pool.acquire(max_wait=120) is route
+        assert clock.now >= 60
+
+    def test_cooldown_longo_nao_falha_as_tarefas(self):
+        """Com todas as rotas em cooldown, usa a que sai dele primeiro"""
+        clock = FakeClock()
+        primeira = EgressRoute("http://primeira:3128", rate=0, clock=clock)
+        segunda = EgressRoute("http://segunda:3128", rate=0, clock=clock)
+        pool = EgressPool([primeira, segunda], clock=clock, sleep=clock.sleep)
+
+        pool.report(primeira, blocked=True)
+        pool.report(primeira, blocked=True)
+        pool.report(segunda, blocked=True)
+
+        assert pool.acquire(max_wait=30) is segunda
+        assert clock.now == 0
+
+    def test_503_nao_coloca_rota_em_cooldown(self):
+        """Um 503 (sobrecarga da SEFAZ) só piora a pontuação da única rota"""
+        clock = FakeClock()
+        route = EgressRoute("direct", rate=0, clock=clock)
+        pool = EgressPool([route], clock=clock, sleep=clock.sleep)
+        response = Mock(ok=False, status_code=503, text="")
+        response.raise_for_status.side_effect = requests.HTTPError("503")
+        route.post = Mock(return_value=response)
+
+        with pytest.raises(Exception, match="503"):
+            perform_scraping("00012377000160", pool=pool)
+
+        assert route.cooldown_until == 0
+        assert route.error_ewma > 0
+        assert pool.acquire(max_wait=0, fallback=False) is route
+        assert clock.now == 0
+
+    def test_orcamento_por_rota(self):
+        """Esgotado o burst, a rota espera o reabastecimento do orçamento"""
+        clock = FakeClock()
+        route = EgressRoute("direct", rate=2, burst=2, clock=clock)
+        pool = EgressPool([route], clock=clock, sleep=clock.sleep)
+
+        pool.acquire()
+        pool.acquire()
+        assert clock.now == 0
+        pool.acquire()
+        assert clock.now == pytest.approx(0.5)
+
+
+class TestEgressProxies:
+    """Testes do scraping através de proxies locais"""
+
+    def test_scraping_evita_proxy_bloqueado(self):
+        """Após um bloqueio, o scraping passa a usar o outro proxy"""
+        bloqueado = stand_in_proxy(403)
+        saudavel = stand_in_proxy(200)
+        try:
+            rotas = [
+                EgressRoute(f"http://127.0.0.1:{server.server_port}", rate=0)
+                for server in (bloqueado, saudavel)
+            ]
+            pool = EgressPool(rotas)
+            # Força a primeira tentativa pelo proxy bloqueado
+            rotas[1].latency_ewma = 10.0
+
+            with patch(
+                "worker.scraper.SINTEGRA_URL", "http://sintegra.test/consultar.asp"
+            ):
+                with pytest.raises(Exception, match="403"):
+                    perform_scraping("00012377000160", pool=pool)
+                scraped_cnpj = perform_scraping("00012377000160", pool=pool)
+
+            assert scraped_cnpj.cnpj == "00.012.377/0001-60"
+            assert rotas[0].cooldown_until > 0
+            assert rotas[1].latency_ewma < 10.0
+        finally:
+            bloqueado.shutdown()
+            saudavel.shutdown()
@@ -0,0 +1,131 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from tests.fixtures import HTML_RESULTADO
+from worker.hedging import HedgeBudget, Hedger, LatencyTracker
+from worker.scraper import perform_scraping
+
+
+def tracker_com_latencia(latency: float) -> LatencyTracker:
+    tracker = LatencyTracker()
+    for _ in range(50):
+        tracker.record(latency)
+    return tracker
+
+
+def hedger_imediato() -> Hedger:
+    return Hedger(
+        enabled=True, tracker=tracker_com_latencia(0.01), budget=HedgeBudget(100)
+    )
+
+
+def rota(nome: str, status_code: int = 200, delay: float = 0.0) -> Mock:
+    response = Mock(ok=status_code < 400, status_code=status_code, text=HTML_RESULTADO)
+    route = Mock()
+    route.name = nome
+    route.post.side_effect = lambda *args, **kwargs: time.sleep(delay) or response
+    return route
+
+
+class TestHedging:
+    """Testes das requisições duplicadas (hedging) ao Sintegra"""
+
+    def test_percentil_das_latencias(self):
+        """O limiar só existe depois de amostras suficientes"""
+        tracker = LatencyTracker()
+        assert tracker.percentile(95) is None
+
+        for latency in range(1, 101):
+            tracker.record(latency / 100)
+        assert tracker.percentile(95) == 0.96
+        assert tracker.percentile(50) == 0.51
+
+    def test_orcamento_limita_requisicoes_extras(self):
+        """O hedging não passa do percentual configurado"""
+        budget = HedgeBudget(percent=10)
+        spent = 0
+        for _ in range(100):
+            budget.record_request()
+            spent += budget.try_spend()
+        assert spent == 10
+
+    def test_segunda_tentativa_vence_a_lenta(self):
+        """Quando a primeira tentativa atrasa, a resposta da segunda é usada"""
+        hedger = Hedger(
+            enabled=True, tracker=tracker_com_latencia(0.01), budget=HedgeBudget(100)
+        )
+        slow_response, fast_response = Mock(), Mock()
+        release = threading.Event()
+        calls = []
+
+        def attempt():
+            calls.append(None)
+            if len(calls) == 1:
+                release.wait(5)
+                return slow_response
+            return fast_response
+
+        started_at = time.monotonic()
+        assert hedger.call(attempt) is fast_response
+        assert time.monotonic() - started_at < 1
+        assert hedger.hedged == 1
+
+        release.set()
+        hedger.executor.shutdown(wait=True)
+        slow_response.close.assert_called_once()
+
+    def test_sem_orcamento_aguarda_a_primeira(self):
+        """Sem orçamento, nenhuma tentativa extra é disparada"""
+        hedger = Hedger(
+            enabled=True, tracker=tracker_com_latencia(0.01), budget=HedgeBudget(0)
+        )
+        attempt = Mock(side_effect=lambda: time.sleep(0.7) or "resposta")
+
+        assert hedger.call(attempt) == "resposta"
+        assert attempt.call_count == 1
+        assert hedger.hedged == 0
+
+    def test_resposta_de_erro_nao_vence(self):
+        """Um 503 rápido da tentativa extra não substitui um 200 lento"""
+        hedger = hedger_imediato()
+        ok_response = Mock(ok=True)
+        blocked_response = Mock(ok=False)
+        calls = []
+
+        def attempt():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.7)
+                return ok_response
+            return blocked_response
+
+        assert hedger.call(attempt) is ok_response
+        hedger.executor.shutdown(wait=True)
+        blocked_response.close.assert_called_once()
+        ok_response.close.assert_not_called()
+
+    def test_espera_por_rota_nao_dispara_hedging(self):
+        """O prazo do hedging só começa depois que a rota foi reservada"""
+        route = rota("direct")
+        pool = Mock()
+        pool.acquire.side_effect = lambda **kwargs: time.sleep(0.7) or route
+
+        perform_scraping("00012377000160", pool=pool, hedger=hedger_imediato())
+
+        pool.acquire.assert_called_once_with()
+        route.post.assert_called_once()
+
+    def test_hedging_evita_a_rota_em_uso(self):
+        """A tentativa extra sai por outra rota que não a da primeira"""
+        lenta, rapida = rota("lenta", delay=0.7), rota("rapida")
+        pool = Mock()
+        pool.acquire.side_effect = [lenta, rapida]
+
+        scraped_cnpj = perform_scraping(
+            "00012377000160", pool=pool, hedger=hedger_imediato()
+        )
+
+        assert scraped_cnpj.cnpj == "00.012.377/0001-60"
+        pool.acquire.assert_called_with(max_wait=0, avoid={lenta}, fallback=False)
+        rapida.post.assert_called_once()
@@ -0,0 +1,102 @@
+import pstats
+import threading
+import time
+from unittest.mock import patch
+
+from tests.fixtures import HTML_RESULTADO
+from worker import profiling
+from worker.profiling import SamplingProfiler, capture_slow_task
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfiling:
+    """Testes do profiling do worker"""
+
+    def test_sampling_profiler_collapsed_stacks(self, tmp_path):
+        """As amostras são gravadas no formato de flame graph"""
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_loop, args=(stop,))
+        thread.start()
+
+        profiler = SamplingProfiler(interval=0.001)
+        with patch.object(profiling, "PROFILE_DIR", str(tmp_path)):
+            profiler.start()
+            time.sleep(0.1)
+            path = profiler.stop()
+        stop.set()
+        thread.join()
+
+        lines = open(path).read().splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert any("test_profiling.py:busy_loop" in line for line in lines)
+
+    def test_capture_slow_task(self, tmp_path):
+        """Tarefas lentas têm HTML, tempos e cProfile guardados"""
+        trace = {"html": HTML_RESULTADO, "parse_seconds": 0.01}
+        with (
+            patch.object(profiling, "PROFILE_DIR", str(tmp_path)),
+            patch.object(profiling, "_last_capture", None),
+        ):
+            assert not capture_slow_task("rapida", "1", trace, total=1.0)
+            assert capture_slow_task("lenta", "1", trace, total=60.0)
+
+        files = sorted(p.suffix for p in tmp_path.iterdir())
+        assert files == [".html", ".json", ".prof"]
+        prof = next(tmp_path.glob("*.prof"))
+        stats = pstats.Stats(str(prof))
+        assert any(func[2] == "parse_results_html" for func in stats.stats)
+
+    def test_capture_slow_task_limitada(self, tmp_path):
+        """Capturas respeitam o intervalo mínimo e as mais antigas são removidas"""
+        trace = {"parse_seconds": 0.01}
+        with (
+            patch.object(profiling, "PROFILE_DIR", str(tmp_path)),
+            patch.object(profiling, "_last_capture", None),
+            patch.object(profiling, "SLOW_TASK_MIN_INTERVAL", 0),
+        ):
+            for i in range(5):
+                assert capture_slow_task(f"lenta{i}", "1", trace, total=60.0)
+            profiling.rotate_captures(max_captures=2)
+
+            with patch.object(profiling, "SLOW_TASK_MIN_INTERVAL", 60):
+                assert capture_slow_task("lenta5", "1", trace, total=60.0) is False
+
+        restantes = sorted(p.name for p in tmp_path.iterdir())
+        assert len(restantes) == 2
+        assert any("lenta4" in name for name in restantes)
+
+    def test_toggle_sampling_nao_propaga_erros(self, tmp_path):
+        """Um PROFILE_DIR sem permissão de escrita não derruba o worker"""
+        arquivo = tmp_path / "arquivo"
+        arquivo.write_text("")
+        profiler = SamplingProfiler(interval=0.001)
+        with (
+            patch.object(profiling, "sampling_profiler", profiler),
+            patch.object(profiling, "PROFILE_DIR", str(arquivo / "perfis")),
+        ):
+            profiling.toggle_sampling()
+            assert profiler.running
+            profiling.toggle_sampling()
+
+        assert not profiler.running
+
+    def test_sigusr1_alterna_em_outra_thread(self):
+        """O handler do sinal só dispara a alternância em uma thread separada"""
+        chamada = threading.Event()
+        threads = []
+
+        def toggle():
+            threads.append(threading.current_thread())
+            chamada.set()
+
+        with patch.object(profiling, "toggle_sampling", toggle):
+            profiling._on_sigusr1(None, None)
+            assert chamada.wait(1)
+
+        assert threads[0] is not threading.current_thread()
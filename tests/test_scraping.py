@@ -1,9 +1,12 @@
-from unittest.mock import Mock, patch
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 from pydantic_core import ValidationError
 
-from worker.models import ScrapedCNPJ
+from app.cnae import formatar_atividades
+from tests.fixtures import HTML_RESULTADO
+from worker.models import AtividadeEconomica, ScrapedCNPJ
 from worker.scraper import normalize_key, parse_results_html, perform_scraping
 
 
@@ -62,19 +65,7 @@ class TestScrapingEssentials:
     def test_perform_scraping_success(self, mock_post):
         """Teste básico de scraping"""
         mock_response = Mock()
-        mock_response.text = """
-        <div class="item">
-            <span class="label_title">CNPJ:</span>
-            <span class="label_text">00.012.377/0001-60</span>
-        </div>
-        <div class="col box">
-            <div class="box_title">Atividade Econômica</div>
-            <span class="label_text">Atividade Principal</span>
-            <span class="label_text" style="font-weight: normal;">
-            4741500 - Comércio varejista de tintas e materiais para pintura
-            </span>
-        </div>
-        """
+        mock_response.text = HTML_RESULTADO
         mock_response.raise_for_status.return_value = None
         mock_post.return_value = mock_response
 
@@ -86,6 +77,85 @@ class TestScrapingEssentials:
         assert "sintegra/consulta/consultar.asp" in call_args[0][0]
 
 
+class TestCNAE:
+    """Testes da representação compacta dos CNAE's"""
+
+    HTML_ATIVIDADES = """
+    <div class="item">
+        <span class="label_title">CNPJ:</span>
+        <span class="label_text">00.012.377/0001-60</span>
+    </div>
+    <div class="col box">
+        <div class="box_title">Atividade Econômica</div>
+        <span class="label_text">Atividade Principal</span>
+        <span class="label_text" style="font-weight: normal;">
+        1041400 - Fabricação de óleos vegetais em bruto, exceto óleo de milho
+        </span>
+        <span class="label_text">Atividade Secundaria</span>
+        <span class="label_text" style="font-weight: normal;">
+        4930202 - Transporte rodoviário de carga
+        </span>
+    </div>
+    """
+
+    def test_descricoes_compartilhadas(self):
+        """CNAE's iguais em resultados diferentes compartilham a descrição"""
+        primeiro = parse_results_html(self.HTML_ATIVIDADES)
+        segundo = parse_results_html(self.HTML_ATIVIDADES)
+
+        assert (
+            primeiro.atividade_economica.atividade_principal[0].descricao
+            is segundo.atividade_economica.atividade_principal[0].descricao
+        )
+
+    def test_serializacao_legada_e_compacta(self):
+        """O formato legado continua sendo o padrão da serialização"""
+        atividades = parse_results_html(self.HTML_ATIVIDADES).atividade_economica
+
+        assert atividades.model_dump()["atividade_secundaria"] == [
+            {"4930202": "Transporte rodoviário de carga"}
+        ]
+        compacto = atividades.model_dump(context={"compacto": True})
+        assert compacto == {
+            "atividade_principal": ["1041400"],
+            "atividade_secundaria": ["4930202"],
+        }
+        assert AtividadeEconomica.model_validate(compacto) == atividades
+
+    def test_formatar_atividades(self):
+        """Teste da expansão dos códigos com a tabela de CNAE's do Redis"""
+        redis_client = Mock()
+        redis_client.hmget = AsyncMock(return_value=["Descrição de teste"])
+        result = {
+            "cnpj": "1",
+            "atividade_economica": {
+                "atividade_principal": ["9999999"],
+                "atividade_secundaria": [{"4930202": "Transporte"}],
+            },
+        }
+
+        completo = asyncio.run(formatar_atividades(redis_client, result, False))
+        assert completo["atividade_economica"] == {
+            "atividade_principal": [{"9999999": "Descrição de teste"}],
+            "atividade_secundaria": [{"4930202": "Transporte"}],
+        }
+        redis_client.hmget.assert_awaited_once_with("cnae:descricoes", ["9999999"])
+
+        compacto = asyncio.run(formatar_atividades(redis_client, result, True))
+        assert compacto["atividade_economica"]["atividade_secundaria"] == ["4930202"]
+
+    def test_formatar_atividades_sem_descricao(self):
+        """CNAE's ausentes da tabela saem sem descrição, não com texto vazio"""
+        redis_client = Mock()
+        redis_client.hmget = AsyncMock(return_value=[None])
+        result = {"atividade_economica": {"atividade_principal": ["8888888"]}}
+
+        completo = asyncio.run(formatar_atividades(redis_client, result, False))
+        assert completo["atividade_economica"]["atividade_principal"] == [
+            {"8888888": None}
+        ]
+
+
 class TestScrapingReal:
     """Teste com o CNPJ real específico"""
 
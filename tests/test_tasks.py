@@ -0,0 +1,348 @@
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import pytest
+from fastapi import HTTPException
+from redis.exceptions import WatchError
+
+from app.main import lookup_cnpj
+from app.tasks import (
+    aguardar_conclusao,
+    buscar_ou_criar_tarefa,
+    cancelar_tarefa,
+    expirar_tarefa,
+    tarefa_aproveitavel,
+    tarefa_vencida,
+)
+
+
+def redis_assincrono(valores: dict) -> Mock:
+    """Mock do Redis assíncrono com GET sobre um dicionário"""
+    redis_client = Mock()
+    redis_client.get = AsyncMock(side_effect=lambda key: valores.get(key))
+    redis_client.set = AsyncMock()
+    redis_client.delete = AsyncMock()
+    redis_client.eval = AsyncMock()
+    return redis_client
+
+
+class TestLookupCNPJ:
+    """Testes da consulta síncrona por CNPJ"""
+
+    def test_tarefa_aproveitavel(self):
+        """Só tarefas em andamento ou resultados recentes são reaproveitados"""
+        agora = time.time()
+        assert tarefa_aproveitavel({"status": "processing"})
+        assert tarefa_aproveitavel({"status": "completed", "completed_at": agora})
+        assert not tarefa_aproveitavel(
+            {"status": "completed", "completed_at": agora - 7200}
+        )
+        assert not tarefa_aproveitavel({"status": "failed"})
+        assert not tarefa_aproveitavel(None)
+
+    def test_tarefa_em_andamento_apos_deadline(self):
+        """Tarefas em andamento cujo deadline passou não são reaproveitadas"""
+        agora = time.time()
+        assert tarefa_aproveitavel({"status": "pending", "deadline": agora + 60})
+        assert not tarefa_aproveitavel({"status": "pending", "deadline": agora - 1})
+
+    def test_substitui_tarefa_em_andamento_vencida(self):
+        """Uma tarefa presa em andamento após o deadline é trocada por uma nova"""
+        vencida = {"task_id": "a", "status": "processing", "deadline": time.time() - 1}
+        redis_client = redis_assincrono(
+            {"cnpj:00012377000160": "a", "task:a": json.dumps(vencida)}
+        )
+        redis_client.eval.side_effect = lambda script, n, key, atual, nova, ttl: nova
+        transport = Mock(publish=AsyncMock())
+
+        task_data, criada = asyncio.run(
+            buscar_ou_criar_tarefa(redis_client, transport, "00012377000160")
+        )
+
+        assert criada
+        assert task_data["task_id"] != "a"
+        assert redis_client.eval.call_args[0][3] == "a"
+        transport.publish.assert_awaited_once()
+
+    def test_aproveita_tarefa_em_andamento(self):
+        """Uma consulta em andamento é reaproveitada sem publicar outra"""
+        tarefa = {"task_id": "a", "status": "processing"}
+        redis_client = redis_assincrono(
+            {"cnpj:00012377000160": "a", "task:a": json.dumps(tarefa)}
+        )
+        transport = Mock(publish=AsyncMock())
+
+        task_data, criada = asyncio.run(
+            buscar_ou_criar_tarefa(redis_client, transport, "00.012.377/0001-60")
+        )
+
+        assert task_data == tarefa
+        assert not criada
+        transport.publish.assert_not_called()
+
+    def test_cria_tarefa_quando_anterior_falhou(self):
+        """Uma tarefa nova substitui no índice a que falhou"""
+        redis_client = redis_assincrono(
+            {
+                "cnpj:00012377000160": "a",
+                "task:a": json.dumps({"task_id": "a", "status": "failed"}),
+            }
+        )
+        redis_client.eval.side_effect = lambda script, n, key, atual, nova, ttl: nova
+        transport = Mock(publish=AsyncMock())
+
+        task_data, criada = asyncio.run(
+            buscar_ou_criar_tarefa(redis_client, transport, "00012377000160")
+        )
+
+        assert criada
+        assert task_data["status"] == "pending"
+        assert redis_client.eval.call_args[0][3] == "a"
+        message = transport.publish.call_args[0][0]
+        assert message["task_id"] == task_data["task_id"]
+
+    def test_junta_se_a_tarefa_criada_em_paralelo(self):
+        """Se outra requisição criou a tarefa primeiro, ela é reaproveitada"""
+        valores = {}
+        redis_client = redis_assincrono(valores)
+        transport = Mock(publish=AsyncMock())
+
+        def outra_requisicao_venceu(script, n, key, atual, nova, ttl):
+            valores[key] = "b"
+            valores["task:b"] = json.dumps({"task_id": "b", "status": "pending"})
+            return "b"
+
+        redis_client.eval.side_effect = outra_requisicao_venceu
+
+        task_data, criada = asyncio.run(
+            buscar_ou_criar_tarefa(redis_client, transport, "00012377000160")
+        )
+
+        assert task_data["task_id"] == "b"
+        assert not criada
+        redis_client.delete.assert_awaited_once()
+        transport.publish.assert_not_called()
+
+
+class TestCancelamento:
+    """Testes do cancelamento de tarefas"""
+
+    def pipeline(self, *registros) -> tuple[MagicMock, MagicMock]:
+        pipe = MagicMock()
+        pipe.watch = AsyncMock()
+        pipe.get = AsyncMock(side_effect=[json.dumps(r) for r in registros])
+        pipe.execute = AsyncMock()
+        redis_client = MagicMock()
+        redis_client.pipeline.return_value.__aenter__.return_value = pipe
+        return redis_client, pipe
+
+    def test_cancela_tarefa_em_andamento(self):
+        """Tarefas pendentes são marcadas como canceladas mantendo o TTL"""
+        redis_client, pipe = self.pipeline({"task_id": "a", "status": "pending"})
+
+        task_data = asyncio.run(cancelar_tarefa(redis_client, "a"))
+
+        assert task_data["status"] == "cancelled"
+        key, saved = pipe.set.call_args[0]
+        assert key == "task:a"
+        assert json.loads(saved)["status"] == "cancelled"
+        assert pipe.set.call_args[1] == {"keepttl": True, "xx": True}
+        pipe.publish.assert_called_once_with("task_done:a", "cancelled")
+
+    def test_nao_sobrescreve_conclusao_concorrente(self):
+        """Se o worker concluir a tarefa durante o cancelamento, ela não muda"""
+        redis_client, pipe = self.pipeline(
+            {"task_id": "a", "status": "processing"},
+            {"task_id": "a", "status": "completed"},
+        )
+        pipe.execute.side_effect = WatchError()
+
+        task_data = asyncio.run(cancelar_tarefa(redis_client, "a"))
+
+        assert task_data["status"] == "completed"
+        assert pipe.watch.await_count == 2
+        pipe.execute.assert_awaited_once()
+
+    def test_tarefa_vencida(self):
+        """Só tarefas em andamento com deadline no passado estão vencidas"""
+        agora = time.time()
+        assert tarefa_vencida({"status": "pending", "deadline": agora - 1})
+        assert not tarefa_vencida({"status": "pending", "deadline": agora + 60})
+        assert not tarefa_vencida({"status": "completed", "deadline": agora - 1})
+        assert not tarefa_vencida({"status": "pending"})
+
+    def test_expira_tarefa_removida_da_fila(self):
+        """Tarefas vencidas sem worker são marcadas e contadas como expiradas"""
+        redis_client, pipe = self.pipeline(
+            {"task_id": "a", "status": "pending", "deadline": time.time() - 1}
+        )
+
+        task_data = asyncio.run(expirar_tarefa(redis_client, "a"))
+
+        assert task_data["status"] == "expired"
+        assert json.loads(pipe.set.call_args[0][1])["status"] == "expired"
+        pipe.hincrby.assert_called_once_with("stats:worker", "descartadas_expiradas")
+        pipe.publish.assert_called_once_with("task_done:a", "expired")
+
+
+def redis_com_pubsub(*registros, mensagens=()) -> tuple[MagicMock, MagicMock]:
+    """Mock do Redis assíncrono cujo GET devolve os registros em sequência"""
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    fila = list(mensagens)
+
+    async def get_message(ignore_subscribe_messages, timeout):
+        if fila:
+            return fila.pop(0)
+        await asyncio.sleep(timeout)
+        return None
+
+    pubsub.get_message = AsyncMock(side_effect=get_message)
+    redis_client = MagicMock()
+    redis_client.pubsub.return_value.__aenter__.return_value = pubsub
+    redis_client.get = AsyncMock(
+        side_effect=[json.dumps(r) if r else None for r in registros]
+    )
+    return redis_client, pubsub
+
+
+class TestAguardarConclusao:
+    """Testes da espera pela conclusão de uma tarefa via pub/sub"""
+
+    def test_notificacao_antes_do_prazo(self):
+        """A notificação de conclusão acorda a espera com a tarefa concluída"""
+        redis_client, pubsub = redis_com_pubsub(
+            {"task_id": "a", "status": "processing"},
+            {"task_id": "a", "status": "completed"},
+            mensagens=[{"channel": "task_done:a", "data": "completed"}],
+        )
+
+        task_data = asyncio.run(aguardar_conclusao(redis_client, "a", 5))
+
+        assert task_data["status"] == "completed"
+        pubsub.subscribe.assert_awaited_once_with("task_done:a")
+
+    def test_prazo_esgotado(self):
+        """Sem notificação dentro do prazo, a espera retorna None"""
+        redis_client, _ = redis_com_pubsub({"task_id": "a", "status": "pending"})
+
+        started_at = time.monotonic()
+        assert asyncio.run(aguardar_conclusao(redis_client, "a", 0.05)) is None
+        assert time.monotonic() - started_at < 1
+
+    def test_tarefa_ja_finalizada_ao_inscrever(self):
+        """Uma tarefa que terminou antes da inscrição não espera notificação"""
+        redis_client, pubsub = redis_com_pubsub({"task_id": "a", "status": "failed"})
+
+        task_data = asyncio.run(aguardar_conclusao(redis_client, "a", 5))
+
+        assert task_data["status"] == "failed"
+        pubsub.get_message.assert_not_called()
+
+    def test_registro_removido_durante_a_espera(self):
+        """Se o registro da tarefa some no meio da espera, retorna None"""
+        redis_client, _ = redis_com_pubsub(
+            {"task_id": "a", "status": "processing"},
+            None,
+            mensagens=[{"channel": "task_done:a", "data": "completed"}],
+        )
+
+        assert asyncio.run(aguardar_conclusao(redis_client, "a", 5)) is None
+
+
+def requisicao() -> Mock:
+    request = Mock()
+    request.app.state.redis = Mock()
+    request.app.state.transport = Mock()
+    return request
+
+
+def consultar(task_data: dict, criada: bool, concluida: dict | None = None):
+    """Executa lookup_cnpj com a busca e a espera simuladas"""
+    with (
+        patch("app.main.registrar_popularidade", AsyncMock()),
+        patch("app.main.registrar_consulta", AsyncMock()) as registrar_consulta,
+        patch(
+            "app.main.buscar_ou_criar_tarefa",
+            AsyncMock(return_value=(task_data, criada)),
+        ),
+        patch(
+            "app.main.aguardar_conclusao", AsyncMock(return_value=concluida)
+        ) as aguardar,
+        patch(
+            "app.main.formatar_atividades",
+            AsyncMock(side_effect=lambda redis, result, compacto: result),
+        ),
+    ):
+        response = asyncio.run(
+            lookup_cnpj(requisicao(), "00012377000160", timeout=1, formato="completo")
+        )
+    campos = [c[0][1] for c in registrar_consulta.await_args_list]
+    return response, campos, aguardar
+
+
+class TestLookupEndpoint:
+    """Testes do endpoint GET /cnpj/{cnpj} com Redis simulado"""
+
+    def test_acerto_nao_aguarda(self):
+        """Um resultado recente é servido direto e contado como acerto"""
+        tarefa = {
+            "task_id": "a",
+            "status": "completed",
+            "completed_at": time.time(),
+            "result": {"cnpj": "1"},
+        }
+
+        response, campos, aguardar = consultar(tarefa, criada=False)
+
+        assert response == tarefa
+        assert campos == ["acertos"]
+        aguardar.assert_not_called()
+
+    def test_falha_aguarda_conclusao(self):
+        """Uma tarefa criada é contada como falha e aguardada até concluir"""
+        tarefa = {"task_id": "a", "status": "pending"}
+        concluida = {"task_id": "a", "status": "completed", "result": {"cnpj": "1"}}
+
+        response, campos, aguardar = consultar(tarefa, True, concluida)
+
+        assert response == concluida
+        assert campos == ["falhas"]
+        aguardar.assert_awaited_once()
+
+    def test_prazo_esgotado_responde_202(self):
+        """Se a tarefa não termina dentro do timeout, responde 202"""
+        tarefa = {"task_id": "a", "status": "processing"}
+
+        response, campos, _ = consultar(tarefa, criada=False, concluida=None)
+
+        assert response.status_code == 202
+        body = json.loads(response.body)
+        assert body["task_id"] == "a"
+        assert body["message"].endswith("/results/a")
+        assert campos == ["juncoes"]
+
+    def test_estado_final_nao_responde_202(self):
+        """Tarefas canceladas ou expiradas são retornadas com o seu status"""
+        tarefa = {"task_id": "a", "status": "pending"}
+        cancelada = {"task_id": "a", "status": "cancelled"}
+
+        response, _, _ = consultar(tarefa, criada=False, concluida=cancelada)
+
+        assert response == cancelada
+
+    def test_cnpj_invalido_rejeitado(self):
+        """Entradas que não têm 14 dígitos são rejeitadas antes de tocar no Redis"""
+        request = requisicao()
+        with (
+            patch("app.main.registrar_popularidade", AsyncMock()) as popularidade,
+            patch("app.main.buscar_ou_criar_tarefa", AsyncMock()) as buscar,
+        ):
+            with pytest.raises(HTTPException) as erro:
+                asyncio.run(lookup_cnpj(request, "abc", timeout=1, formato="completo"))
+
+        assert erro.value.status_code == 422
+        popularidade.assert_not_called()
+        buscar.assert_not_called()
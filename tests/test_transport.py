@@ -0,0 +1,85 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.transport import InProcessTransport, RabbitMQPublisher
+from worker.consumer import handle_message
+from worker.transport import RedisStreamsTransport
+
+
+class TestTransports:
+    """Testes dos transportes de fila que não dependem de um broker"""
+
+    def test_inprocess_transport_delivers_messages(self):
+        """Teste de entrega das mensagens pela fila em memória"""
+        received = []
+
+        async def run():
+            transport = InProcessTransport(received.append, workers=2)
+            await transport.connect()
+            for i in range(5):
+                await transport.publish({"task_id": str(i), "cnpj": "1"})
+            await transport.queue.join()
+            await transport.close()
+
+        asyncio.run(run())
+        assert sorted(m["task_id"] for m in received) == ["0", "1", "2", "3", "4"]
+
+    def test_redis_streams_acks_failed_messages(self):
+        """Mensagens com erro são confirmadas para não ficarem pendentes"""
+        redis_client = Mock()
+        transport = RedisStreamsTransport(redis_client, consumer="teste")
+        handler = Mock(side_effect=Exception("falhou"))
+
+        transport._handle(handler, "1-0", {"payload": '{"task_id": "a"}'})
+
+        handler.assert_called_once_with({"task_id": "a"})
+        redis_client.xack.assert_called_once_with(
+            "scrape_tasks", "scrape_workers", "1-0"
+        )
+
+    def test_redis_streams_claim_stuck(self):
+        """Teste de reprocessamento das mensagens pendentes via XAUTOCLAIM"""
+        redis_client = Mock()
+        redis_client.xautoclaim.return_value = [
+            "0-0",
+            [("1-0", {"payload": '{"task_id": "a"}'}), ("2-0", {})],
+            [],
+        ]
+        transport = RedisStreamsTransport(redis_client, consumer="teste")
+        handler = Mock(return_value=True)
+
+        assert transport.claim_stuck(handler) == 1
+        handler.assert_called_once_with({"task_id": "a"})
+
+    @patch("worker.consumer.process_task")
+    def test_handle_message_invalid(self, mock_process_task):
+        """Mensagens sem task_id ou cnpj são descartadas"""
+        assert handle_message({"task_id": "a"}, Mock()) is False
+        mock_process_task.assert_not_called()
+
+    def test_worker_encerra_com_fila_em_memoria(self):
+        """Com QUEUE_BACKEND=memory o worker não tenta criar um transporte"""
+        from worker import consumer
+
+        with (
+            patch.object(consumer, "QUEUE_BACKEND", "memory"),
+            patch.object(consumer, "install_signal_handler"),
+            patch.object(consumer, "get_redis_connection") as mock_redis,
+            patch.object(consumer, "create_transport") as mock_create,
+        ):
+            consumer.main()
+
+        mock_redis.assert_not_called()
+        mock_create.assert_not_called()
+
+    def test_rabbitmq_depth_nao_registra_fila_robusta(self):
+        """A leitura da profundidade não acumula filas no canal robusto"""
+        queue = Mock()
+        queue.declaration_result.message_count = 7
+        publisher = RabbitMQPublisher()
+        publisher.channel = Mock(declare_queue=AsyncMock(return_value=queue))
+
+        assert asyncio.run(publisher.depth()) == 7
+        publisher.channel.declare_queue.assert_awaited_once_with(
+            "scrape_tasks", passive=True, robust=False
+        )
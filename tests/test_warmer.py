@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, Mock
+
+from app.warmer import CacheWarmer, acerto_aquecido, taxas_de_acerto
+
+
+def redis_com_resultados(resultados: dict[str, float]) -> Mock:
+    """Mock do Redis assíncrono com um resultado concluído por CNPJ"""
+    valores = {}
+    for cnpj, completed_at in resultados.items():
+        valores[f"cnpj:{cnpj}"] = cnpj
+        valores[f"task:{cnpj}"] = json.dumps(
+            {"task_id": cnpj, "status": "completed", "completed_at": completed_at}
+        )
+
+    redis_client = Mock()
+    redis_client.get = AsyncMock(side_effect=lambda key: valores.get(key))
+    redis_client.set = AsyncMock(return_value=True)
+    redis_client.zrevrange = AsyncMock(return_value=list(resultados))
+    redis_client.hincrby = AsyncMock()
+    redis_client.hgetall = AsyncMock(return_value={})
+    redis_client.zunionstore = AsyncMock()
+    return redis_client
+
+
+class TestCacheWarmer:
+    """Testes do aquecimento dos CNPJ's mais consultados"""
+
+    def test_taxas_de_acerto(self):
+        """O ganho conta só os acertos servidos por resultados aquecidos"""
+        taxas = taxas_de_acerto(
+            {"acertos": 6, "juncoes": 1, "falhas": 3, "acertos_aquecidos": 2}
+        )
+        assert taxas == {"taxa_acerto": 0.6, "ganho_aquecimento": 0.2}
+        assert taxas_de_acerto({})["taxa_acerto"] == 0.0
+
+    def test_aquece_apenas_resultados_perto_de_expirar(self):
+        """Resultados ainda novos não são atualizados"""
+        agora = time.time()
+        redis_client = redis_com_resultados(
+            {"11111111000111": agora - 3500, "22222222000122": agora - 60}
+        )
+        transport = Mock(publish=AsyncMock(), depth=AsyncMock(return_value=0))
+        warmer = CacheWarmer(redis_client, transport)
+
+        assert asyncio.run(warmer.ciclo()) == 1
+
+        message = transport.publish.call_args[0][0]
+        assert message["cnpj"] == "11111111000111"
+        # O índice do CNPJ continua no resultado atual até a atualização terminar
+        keys = [call[0][0] for call in redis_client.set.call_args_list]
+        assert "cnpj:11111111000111" not in keys
+
+    def test_pula_ciclo_com_fila_cheia(self):
+        """O aquecimento só usa a folga da fila"""
+        redis_client = redis_com_resultados({"11111111000111": time.time() - 3500})
+        transport = Mock(publish=AsyncMock(), depth=AsyncMock(return_value=100))
+        warmer = CacheWarmer(redis_client, transport)
+
+        assert asyncio.run(warmer.ciclo()) == 0
+        transport.publish.assert_not_called()
+
+    def test_limita_ciclo_a_folga_da_fila(self):
+        """Cada ciclo enfileira no máximo o que falta para encher a folga"""
+        agora = time.time()
+        redis_client = redis_com_resultados(
+            {f"{i:014d}": agora - 3500 for i in range(1, 6)}
+        )
+        transport = Mock(publish=AsyncMock(), depth=AsyncMock(return_value=3))
+        warmer = CacheWarmer(redis_client, transport)
+
+        assert asyncio.run(warmer.ciclo()) == 2
+        assert transport.publish.await_count == 2
+
+    def test_acerto_aquecido(self):
+        """Só conta como ganho quando o resultado substituído já estaria velho"""
+        agora = time.time()
+        novo = {"aquecida": True, "substitui_completed_at": agora - 3500}
+        velho = {"aquecida": True, "substitui_completed_at": agora - 3700}
+
+        assert not acerto_aquecido(novo)
+        assert acerto_aquecido(velho)
+        assert not acerto_aquecido({"substitui_completed_at": agora - 3700})
+
+    def test_tarefa_de_aquecimento_guarda_resultado_substituido(self):
+        """A tarefa de aquecimento registra quando o resultado atual foi concluído"""
+        completed_at = time.time() - 3500
+        redis_client = redis_com_resultados({"11111111000111": completed_at})
+        transport = Mock(publish=AsyncMock(), depth=AsyncMock(return_value=0))
+
+        asyncio.run(CacheWarmer(redis_client, transport).ciclo())
+
+        saved = json.loads(redis_client.set.call_args_list[-1][0][1])
+        assert saved["aquecida"] is True
+        assert saved["substitui_completed_at"] == completed_at
+
+    def test_decaimento_unico_entre_replicas(self):
+        """Só a réplica que cria a marca no Redis reduz as contagens"""
+        marcas = set()
+
+        async def set_nx(key, value, nx=False, ex=None):
+            if nx and key in marcas:
+                return None
+            marcas.add(key)
+            return True
+
+        redis_client = redis_com_resultados({})
+        redis_client.set = AsyncMock(side_effect=set_nx)
+        transport = Mock(publish=AsyncMock(), depth=AsyncMock(return_value=0))
+
+        for _ in range(3):
+            asyncio.run(CacheWarmer(redis_client, transport).decair_popularidade())
+
+        redis_client.zunionstore.assert_awaited_once_with(
+            "popularidade:cnpj", {"popularidade:cnpj": 0.5}
+        )
+        assert redis_client.set.await_args_list[0][1]["ex"] == 3600
@@ -2,13 +2,15 @@ import json
 import os
 import time
 
-import pika
 import redis
+from worker.profiling import capture_slow_task, install_signal_handler
 from worker.scraper import perform_scraping
+from worker.transport import QUEUE_BACKEND, create_transport
 
-RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-QUEUE_NAME = "scrape_tasks"
+CNAE_KEY = "cnae:descricoes"
+STATS_KEY = "stats:worker"
+ESTADOS_FINAIS = ("completed", "failed", "expired", "cancelled")
 
 
 def get_redis_connection():
@@ -31,98 +33,195 @@ def get_redis_connection():
     raise Exception("Não foi possível se conectar ao Redis.")
 
 
-def get_rabbitmq_connection():
-    """Estabelece a conexão com o servidor RabbitMQ com tentativas de reconexão"""
-    print("Tentando se conectar ao servidor do RabbitMQ...")
-    credentials = pika.PlainCredentials("user", "password")
-    parameters = pika.ConnectionParameters(host=RABBITMQ_HOST, credentials=credentials)
-    retry_interval = 3
-    for _ in range(10):
-        try:
-            connection = pika.BlockingConnection(parameters)
-            print("Conectado ao RabbitMQ com sucesso.")
-            return connection
-        except pika.exceptions.AMQPConnectionError:
-            print(
-                f"Falha ao conectar ao RabbitMQ, tentando novamente em {retry_interval}"
-            )
-            time.sleep(retry_interval)
-    raise Exception("Não foi possível se conectar ao RabbitMQ.")
+def incrementar_contador(redis_client, campo):
+    """Incrementa um dos contadores de trabalho descartado em stats:worker"""
+    try:
+        redis_client.hincrby(STATS_KEY, campo)
+    except Exception as e:
+        print(f"WORKER - ERRO ao incrementar o contador {campo}: {e}")
 
 
 def update_redis(redis_client, task_id, status, result=None):
-    """Atualiza o status da tarefa no Redis"""
+    """
+    Atualiza o status da tarefa no Redis. Tarefas cujo registro já expirou
+    ou que foram canceladas não são regravadas.
+
+    A leitura e a escrita rodam sob WATCH: se a tarefa for alterada no meio
+    (ex.: cancelada pela API), a transação é refeita com o registro novo.
+    """
     try:
         task_key = f"task:{task_id}"
-        task_data_json = redis_client.get(task_key)
-        task_data = json.loads(task_data_json) if task_data_json else {}
-
-        task_data["status"] = status
-        if result:
-            task_data["result"] = result
-
-        redis_client.set(task_key, json.dumps(task_data), ex=3600)
+        with redis_client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(task_key)
+                    task_data_json = pipe.get(task_key)
+                    if not task_data_json:
+                        print(
+                            f"WORKER - Tarefa: {task_id} expirada, status {status} descartado"
+                        )
+                        incrementar_contador(redis_client, "escritas_orfas_evitadas")
+                        return
+
+                    task_data = json.loads(task_data_json)
+                    if task_data.get("status") == "cancelled":
+                        print(
+                            f"WORKER - Tarefa: {task_id} cancelada, status {status} descartado"
+                        )
+                        return
+
+                    task_data["status"] = status
+                    if result:
+                        task_data["result"] = result
+                    if status == "completed":
+                        task_data["completed_at"] = time.time()
+
+                    pipe.multi()
+                    pipe.set(task_key, json.dumps(task_data), ex=3600, xx=True)
+                    pipe.execute()
+                    break
+                except redis.exceptions.WatchError:
+                    continue
         print(f"WORKER - Tarefa: {task_id} Status atualizado para: {status}")
+
+        # Acorda quem aguarda a tarefa em GET /cnpj/{cnpj}
+        if status in ESTADOS_FINAIS:
+            redis_client.publish(f"task_done:{task_id}", status)
     except Exception as e:
         print(f"WORKER - Tarefa: {task_id} ERRO ao atualizar Redis: {e}")
 
 
+def tarefa_descartavel(task_id, message, redis_client):
+    """
+    Verifica, antes de qualquer consulta ao Sintegra, se a tarefa passou do
+    deadline, expirou no Redis ou foi cancelada pelo cliente.
+
+    Returns:
+        True se a tarefa deve ser descartada
+    """
+    deadline = message.get("deadline")
+    task_data_json = redis_client.get(f"task:{task_id}")
+
+    if not task_data_json:
+        print(f"WORKER - Tarefa: {task_id} expirada no Redis, descartada.")
+        incrementar_contador(redis_client, "descartadas_expiradas")
+        return True
+
+    task_status = json.loads(task_data_json).get("status")
+    if task_status == "cancelled":
+        print(f"WORKER - Tarefa: {task_id} cancelada, descartada.")
+        incrementar_contador(redis_client, "descartadas_canceladas")
+        return True
+
+    if task_status == "expired":
+        # Já marcada e contada pela API ao consultar o resultado
+        print(f"WORKER - Tarefa: {task_id} já expirada, descartada.")
+        return True
+
+    if deadline is not None and time.time() > deadline:
+        print(f"WORKER - Tarefa: {task_id} passou do deadline, descartada.")
+        update_redis(redis_client, task_id, "expired")
+        incrementar_contador(redis_client, "descartadas_expiradas")
+        return True
+
+    return False
+
+
+def publicar_cnaes(redis_client, scraped_cnpj):
+    """
+    Grava no Redis as descrições de CNAE do resultado, já que as tarefas
+    guardam apenas os códigos. Roda a cada tarefa (HSETNX não sobrescreve
+    descrições existentes), para que a tabela se recomponha caso a chave
+    seja apagada ou o Redis reiniciado.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for cnae in scraped_cnpj.atividade_economica.cnaes():
+        if cnae.descricao:
+            pipe.hsetnx(CNAE_KEY, cnae.codigo, cnae.descricao)
+    pipe.execute()
+
+
 def process_task(task_id, cnpj, redis_client):
     """Processa a tarefa de scraping para o CNPJ fornecido"""
     print(f"WORKER - Tarefa: {task_id} Recebido. Processando CNPJ: {cnpj}...")
     update_redis(redis_client, task_id, "processing")
 
+    started_at = time.monotonic()
+    trace = {}
     try:
-        result_data = perform_scraping(cnpj)
-
-        update_redis(redis_client, task_id, "completed", result_data.model_dump())
+        result_data = perform_scraping(cnpj, trace=trace)
+
+        publicar_cnaes(redis_client, result_data)
+        update_redis(
+            redis_client,
+            task_id,
+            "completed",
+            result_data.model_dump(context={"compacto": True}),
+        )
+        # Mantém o índice do CNPJ apontando para o resultado mais recente
+        clean_cnpj = "".join(filter(str.isdigit, cnpj))
+        redis_client.set(f"cnpj:{clean_cnpj}", task_id, ex=3600)
         print(f"WORKER - Tarefa: {task_id} - Processamento concluído.")
     except Exception as e:
         print(f"WORKER - Tarefa: {task_id} - Falha no processamento: {e}")
         update_redis(redis_client, task_id, "failed", {"error": str(e)})
+    finally:
+        try:
+            capture_slow_task(task_id, cnpj, trace, time.monotonic() - started_at)
+        except Exception as e:
+            print(f"WORKER - Tarefa: {task_id} ERRO ao capturar tarefa lenta: {e}")
 
 
-def main():
-    print("WORKER - Iniciando o worker de processamento de tarefas...")
-    redis_client = get_redis_connection()
-    rabbit_connection = get_rabbitmq_connection()
+def handle_message(message, redis_client):
+    """
+    Trata uma mensagem recebida da fila, independente do transporte.
 
-    channel = rabbit_connection.channel()
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-    channel.basic_qos(prefetch_count=1)
+    Returns:
+        True se a mensagem foi aceita, False se deve ser descartada
+    """
+    task_id = message.get("task_id")
+    cnpj = message.get("cnpj")
 
-    def callback(ch, method, properties, body):
-        message = json.loads(body.decode())
-        task_id = message.get("task_id")
-        cnpj = message.get("cnpj")
+    if not task_id or not cnpj:
+        print(f"WORKER - Mensagem inválida recebida: {message}")
+        return False
 
-        if not task_id or not cnpj:
-            print(f"WORKER - Mensagem inválida recebida: {body}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-            return
+    try:
+        if tarefa_descartavel(task_id, message, redis_client):
+            return True
 
-        try:
-            process_task(task_id, cnpj, redis_client)
+        process_task(task_id, cnpj, redis_client)
+        return True
+    except Exception as e:
+        print(f"WORKER - Tarefa: {task_id} Falha crítica no processamento: {e}")
 
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"WORKER - Tarefa: {task_id} Falha crítica no processamento: {e}")
+        update_redis(redis_client, task_id, "failed", {"error": str(e)})
 
-            update_redis(redis_client, task_id, "failed", {"error": str(e)})
+        return False
 
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
+def main():
+    print("WORKER - Iniciando o worker de processamento de tarefas...")
+    install_signal_handler()
+    if QUEUE_BACKEND == "memory":
+        # Com a fila em memória, as tarefas são processadas dentro da API
+        print("WORKER - QUEUE_BACKEND=memory: nada a consumir, encerrando.")
+        return
+
+    redis_client = get_redis_connection()
+    transport = create_transport(QUEUE_BACKEND, redis_client)
+    transport.connect()
 
-    print("\nWORKER - Aguardando tarefas. Para sair, pressione CTRL+C")
+    print(
+        f"\nWORKER - Aguardando tarefas ({QUEUE_BACKEND}). Para sair, pressione CTRL+C"
+    )
     try:
-        channel.start_consuming()
+        transport.consume(lambda message: handle_message(message, redis_client))
     except KeyboardInterrupt:
         print("WORKER - Encerrando...")
-        channel.stop_consuming()
+        transport.stop()
     finally:
-        rabbit_connection.close()
-        print("WORKER - Conexão com RabbitMQ fechada.")
+        transport.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Rotas separadas por vírgula: "direct", "http://proxy:3128" ou "source:10.0.0.5"
+EGRESS_ROUTES = os.getenv("EGRESS_ROUTES", "direct")
+# Requisições por segundo por rota (0 = sem limite)
+EGRESS_RATE = float(os.getenv("EGRESS_RATE", "0"))
+EGRESS_BURST = float(os.getenv("EGRESS_BURST", "3"))
+EGRESS_COOLDOWN = float(os.getenv("EGRESS_COOLDOWN", "60"))
+EGRESS_MAX_COOLDOWN = float(os.getenv("EGRESS_MAX_COOLDOWN", "900"))
+EGRESS_MAX_WAIT = float(os.getenv("EGRESS_MAX_WAIT", "30"))
+EGRESS_EWMA_ALPHA = float(os.getenv("EGRESS_EWMA_ALPHA", "0.2"))
+# Meia-vida (s) do retorno da pontuação de uma rota ociosa ao valor inicial,
+# para que rotas penalizadas voltem a ser tentadas
+EGRESS_DECAY_HALF_LIFE = float(os.getenv("EGRESS_DECAY_HALF_LIFE", "300"))
+
+# Status HTTP que indicam que o Sintegra bloqueou ou limitou a rota. O 503 é
+# sobrecarga comum da SEFAZ, não bloqueio do IP, e só conta como erro.
+BLOCK_STATUS_CODES = {403, 429}
+
+LATENCIA_INICIAL = 1.0
+
+
+class SourceAddressAdapter(HTTPAdapter):
+    """Adapter do requests que origina as conexões de um IP local específico"""
+
+    def __init__(self, source_address: str, **kwargs):
+        self.source_address = (source_address, 0)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["source_address"] = self.source_address
+        super().init_poolmanager(*args, **kwargs)
+
+
+class EgressRoute:
+    """
+    Rota de saída para o Sintegra (conexão direta, proxy HTTP ou IP de origem),
+    com orçamento próprio de requisições e pontuação de saúde.
+    """
+
+    def __init__(
+        self,
+        spec: str,
+        rate: float = EGRESS_RATE,
+        burst: float = EGRESS_BURST,
+        clock=time.monotonic,
+    ):
+        self.name = spec
+        self.proxies = None
+        self.session = None
+        if spec.startswith("source:"):
+            self.session = requests.Session()
+            adapter = SourceAddressAdapter(spec.removeprefix("source:"))
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        elif spec != "direct":
+            self.proxies = {"http": spec, "https": spec}
+
+        self.clock = clock
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = clock()
+
+        self.latency_ewma = LATENCIA_INICIAL
+        self.error_ewma = 0.0
+        self.last_report = clock()
+        self.consecutive_blocks = 0
+        self.cooldown_until = 0.0
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        if self.session is not None:
+            return self.session.post(url, **kwargs)
+        return requests.post(url, proxies=self.proxies, **kwargs)
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            elapsed = now - self.last_refill
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def wait_time(self, now: float, ignore_cooldown: bool = False) -> float:
+        """Segundos até a rota poder enviar a próxima requisição"""
+        self._refill(now)
+        wait = 0.0 if ignore_cooldown else max(0.0, self.cooldown_until - now)
+        if self.rate > 0 and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def _decayed(self, now: float) -> tuple[float, float]:
+        """
+        Latência e taxa de erro médias, aproximadas dos valores iniciais
+        conforme o tempo sem novas medições da rota
+        """
+        if EGRESS_DECAY_HALF_LIFE <= 0:
+            return self.latency_ewma, self.error_ewma
+        weight = 0.5 ** (max(0.0, now - self.last_report) / EGRESS_DECAY_HALF_LIFE)
+        latency = LATENCIA_INICIAL + (self.latency_ewma - LATENCIA_INICIAL) * weight
+        return latency, self.error_ewma * weight
+
+    def _apply_decay(self):
+        now = self.clock()
+        self.latency_ewma, self.error_ewma = self._decayed(now)
+        self.last_report = now
+
+    def score(self, now: float | None = None) -> float:
+        """Custo estimado da rota; quanto menor, mais saudável"""
+        latency, error = self._decayed(self.clock() if now is None else now)
+        return latency / max(1.0 - error, 0.05)
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def record_success(self, latency: float):
+        self._apply_decay()
+        self.latency_ewma += EGRESS_EWMA_ALPHA * (latency - self.latency_ewma)
+        self.error_ewma *= 1 - EGRESS_EWMA_ALPHA
+        self.consecutive_blocks = 0
+
+    def record_failure(self, blocked: bool = False):
+        self._apply_decay()
+        self.error_ewma += EGRESS_EWMA_ALPHA * (1.0 - self.error_ewma)
+        if blocked:
+            self.consecutive_blocks += 1
+            cooldown = EGRESS_COOLDOWN * 2 ** (self.consecutive_blocks - 1)
+            self.cooldown_until = self.clock() + min(cooldown, EGRESS_MAX_COOLDOWN)
+
+
+class EgressPool:
+    """Conjunto de rotas de saída; cada requisição usa a rota mais saudável disponível"""
+
+    def __init__(
+        self, routes: list[EgressRoute], clock=time.monotonic, sleep=time.sleep
+    ):
+        if not routes:
+            raise ValueError("O pool de saída precisa de pelo menos uma rota.")
+        self.routes = routes
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def acquire(
+        self,
+        max_wait: float = EGRESS_MAX_WAIT,
+        avoid: set | frozenset = frozenset(),
+        fallback: bool = True,
+    ) -> EgressRoute:
+        """
+        Reserva uma requisição na rota disponível de menor custo, aguardando
+        orçamento ou fim de cooldown por até max_wait segundos. Rotas em
+        `avoid` só são usadas se nenhuma outra estiver disponível.
+
+        Se todas as rotas continuarem em cooldown além de max_wait, usa a que
+        sai dele primeiro (a menos que `fallback` seja False), em vez de
+        falhar todas as tarefas da fila até o fim do cooldown.
+        """
+        deadline = self.clock() + max_wait
+        ignore_cooldown = False
+        while True:
+            with self.lock:
+                now = self.clock()
+                waits = {
+                    route: route.wait_time(now, ignore_cooldown)
+                    for route in self.routes
+                }
+                ready = [route for route, wait in waits.items() if wait == 0]
+                if ready:
+                    route = min(
+                        ready,
+                        key=lambda route: (
+                            route in avoid,
+                            route.cooldown_until if ignore_cooldown else 0.0,
+                            route.score(now),
+                        ),
+                    )
+                    route.take()
+                    return route
+                wait = min(waits.values())
+
+            if now + wait > deadline:
+                if fallback and not ignore_cooldown:
+                    ignore_cooldown = True
+                    continue
+                raise Exception("Nenhuma rota de saída disponível para o Sintegra.")
+            self.sleep(wait)
+
+    def report(
+        self,
+        route: EgressRoute,
+        latency: float | None = None,
+        error: bool = False,
+        blocked: bool = False,
+    ):
+        """Registra o resultado de uma requisição feita pela rota"""
+        with self.lock:
+            if error or blocked:
+                route.record_failure(blocked=blocked)
+            else:
+                route.record_success(latency)
+        if blocked:
+            print(f"EGRESS - Rota {route.name} bloqueada, em cooldown.")
+
+
+_pool = None
+
+
+def get_egress_pool() -> EgressPool:
+    """Pool de saída do processo, montado a partir de EGRESS_ROUTES"""
+    global _pool
+    if _pool is None:
+        specs = [spec.strip() for spec in EGRESS_ROUTES.split(",") if spec.strip()]
+        _pool = EgressPool([EgressRoute(spec) for spec in specs])
+    return _pool
@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, TypeVar
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+# Percentual máximo de requisições extras ao Sintegra causadas por hedging
+HEDGE_BUDGET_PERCENT = float(os.getenv("HEDGE_BUDGET_PERCENT", "5"))
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Janela das latências recentes do Sintegra, para o limiar adaptativo"""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self.lock:
+            self.samples.append(latency)
+
+    def percentile(self, percentile: float) -> float | None:
+        with self.lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    Limita as requisições extras a um percentual das requisições feitas.
+    As contagens decaem pela metade a cada `window` requisições, então o
+    orçamento acompanha a carga recente.
+    """
+
+    def __init__(self, percent: float = HEDGE_BUDGET_PERCENT, window: int = 1000):
+        self.ratio = percent / 100
+        self.window = window
+        self.requests = 0.0
+        self.hedges = 0.0
+        self.lock = threading.Lock()
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+            if self.requests >= self.window:
+                self.requests /= 2
+                self.hedges /= 2
+
+    def try_spend(self) -> bool:
+        with self.lock:
+            if self.hedges + 1 > self.requests * self.ratio:
+                return False
+            self.hedges += 1
+            return True
+
+
+class Hedger:
+    """
+    Dispara uma segunda tentativa quando a primeira passa do percentil
+    HEDGE_PERCENTILE das latências recentes, e usa a primeira que terminar
+    com sucesso.
+
+    Uma requisição do requests não pode ser interrompida no meio; a tentativa
+    perdedora é abandonada e sua resposta fechada assim que ela terminar.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGE_ENABLED,
+        percentile: float = HEDGE_PERCENTILE,
+        tracker: LatencyTracker | None = None,
+        budget: HedgeBudget | None = None,
+        max_workers: int = 8,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedge"
+        )
+        self.hedged = 0
+
+    def threshold(self) -> float | None:
+        latency = self.tracker.percentile(self.percentile)
+        if latency is None:
+            return None
+        return max(latency, HEDGE_MIN_DELAY)
+
+    def call(self, attempt: Callable[[], T], hedge: Callable[[], T] | None = None) -> T:
+        """
+        Executa attempt(), com hedging se estiver habilitado.
+
+        O prazo para a tentativa extra conta a partir desta chamada, então a
+        rota da primeira tentativa deve ser reservada antes.
+
+        Args:
+            attempt: Faz uma requisição ao Sintegra e retorna a resposta
+            hedge: Faz a requisição extra; por padrão, attempt
+        Returns:
+            A resposta da primeira tentativa bem-sucedida (response.ok) ou,
+            se nenhuma for, a da tentativa original
+        """
+        self.budget.record_request()
+        threshold = self.threshold()
+        if not self.enabled or threshold is None:
+            return attempt()
+
+        first = self.executor.submit(attempt)
+        done, _ = wait([first], timeout=threshold)
+        if done or not self.budget.try_spend():
+            return first.result()
+
+        self.hedged += 1
+        second = self.executor.submit(hedge or attempt)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if _succeeded(future):
+                    return _keep(future, first, second)
+
+        # Nenhuma teve sucesso: a resposta da tentativa original é a mais informativa
+        for future in (first, second):
+            if future.exception() is None:
+                return _keep(future, first, second)
+        raise first.exception()
+
+
+def _succeeded(future) -> bool:
+    # Respostas de erro (ex.: 503 de uma rota bloqueada) não vencem a disputa
+    return future.exception() is None and getattr(future.result(), "ok", True)
+
+
+def _keep(winner, *futures):
+    for loser in set(futures) - {winner}:
+        loser.add_done_callback(_close_response)
+    return winner.result()
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
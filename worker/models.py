@@ -1,11 +1,78 @@
+import sys
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, SerializationInfo, model_serializer, model_validator
+
+# Tabela compartilhada código CNAE -> descrição. As descrições são
+# internadas, então todas as empresas com o mesmo CNAE apontam para a
+# mesma string em memória.
+CNAE_DESCRICOES: Dict[str, str] = {}
+
+
+def intern_cnae(codigo: str, descricao: str) -> str:
+    """
+    Registra o CNAE na tabela compartilhada.
+
+    Args:
+        codigo: Código do CNAE
+        descricao: Descrição do CNAE
+    Returns:
+        A instância compartilhada da descrição
+    """
+    compartilhada = CNAE_DESCRICOES.get(codigo)
+    if compartilhada is None or compartilhada != descricao:
+        compartilhada = sys.intern(descricao)
+        CNAE_DESCRICOES[sys.intern(codigo)] = compartilhada
+    return compartilhada
+
+
+class CNAE(BaseModel):
+    """
+    CNAE de uma atividade econômica.
+
+    Aceita o formato legado {codigo: descricao} ou apenas o código (formato
+    compacto, com a descrição vinda da tabela compartilhada). Serializa no
+    formato legado, ou apenas o código com o contexto {"compacto": True}.
+    """
+
+    codigo: str
+    descricao: str
+
+    @model_validator(mode="before")
+    @classmethod
+    def aceitar_formatos(cls, data):
+        if isinstance(data, str):
+            return {"codigo": data, "descricao": CNAE_DESCRICOES.get(data, "")}
+        if isinstance(data, dict) and len(data) == 1 and "codigo" not in data:
+            ((codigo, descricao),) = data.items()
+            return {"codigo": codigo, "descricao": descricao}
+        return data
+
+    @model_validator(mode="after")
+    def compartilhar_descricao(self):
+        if self.descricao:
+            self.descricao = intern_cnae(self.codigo, self.descricao)
+        return self
+
+    @model_serializer(mode="plain")
+    def serializar(self, info: SerializationInfo):
+        if info.context and info.context.get("compacto"):
+            return self.codigo
+        return {self.codigo: self.descricao}
+
+    def __getitem__(self, codigo: str) -> str:
+        """Permite o acesso legado atividade[codigo]"""
+        if codigo != self.codigo:
+            raise KeyError(codigo)
+        return self.descricao
 
 
 class AtividadeEconomica(BaseModel):
-    atividade_principal: List[Dict[str, str]]
-    atividade_secundaria: List[Dict[str, str]]
+    atividade_principal: List[CNAE]
+    atividade_secundaria: List[CNAE]
+
+    def cnaes(self) -> List[CNAE]:
+        return self.atividade_principal + self.atividade_secundaria
 
 
 class ScrapedCNPJ(BaseModel):
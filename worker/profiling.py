@@ -0,0 +1,186 @@
+import cProfile
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from worker.scraper import parse_results_html
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/worker-profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+SLOW_TASK_PARSE_SECONDS = float(os.getenv("SLOW_TASK_PARSE_SECONDS", "0.5"))
+SLOW_TASK_TOTAL_SECONDS = float(os.getenv("SLOW_TASK_TOTAL_SECONDS", "20"))
+# Intervalo mínimo entre capturas e máximo de capturas mantidas em disco, para
+# que uma degradação do Sintegra não encha o PROFILE_DIR nem gaste CPU com cProfile
+SLOW_TASK_MIN_INTERVAL = float(os.getenv("SLOW_TASK_MIN_INTERVAL", "10"))
+SLOW_TASK_MAX_CAPTURES = int(os.getenv("SLOW_TASK_MAX_CAPTURES", "50"))
+
+_last_capture = None
+_capture_lock = threading.Lock()
+
+
+def collapse_stack(frame) -> str:
+    """Converte uma pilha de frames para o formato "raiz;...;folha" do flame graph"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem: uma thread lê periodicamente a pilha de todas
+    as outras threads do processo. A saída está no formato "collapsed stacks",
+    aceito pelo flamegraph.pl, speedscope e similares.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        self.samples.clear()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.samples[collapse_stack(frame)] += 1
+
+    def stop(self) -> str:
+        """Para a amostragem e grava as pilhas coletadas, retornando o caminho"""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            PROFILE_DIR, f"worker-{os.getpid()}-{int(self.started_at)}.folded"
+        )
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+sampling_profiler = SamplingProfiler()
+
+
+_toggle_lock = threading.Lock()
+
+
+def toggle_sampling():
+    """Liga ou desliga o profiler por amostragem"""
+    with _toggle_lock:
+        try:
+            if sampling_profiler.running:
+                path = sampling_profiler.stop()
+                print(f"WORKER - Profiling desligado. Amostras gravadas em {path}")
+            else:
+                sampling_profiler.start()
+                print("WORKER - Profiling por amostragem ligado.")
+        except Exception as e:
+            print(f"WORKER - ERRO ao alternar o profiling: {e}")
+
+
+def _on_sigusr1(signum, frame):
+    # O handler interrompe a thread principal em qualquer ponto (inclusive no
+    # meio de um print), então todo o trabalho roda em outra thread
+    threading.Thread(target=toggle_sampling, daemon=True).start()
+
+
+def install_signal_handler():
+    """Permite ligar/desligar o profiling com `kill -USR1 <pid>`"""
+    signal.signal(signal.SIGUSR1, _on_sigusr1)
+
+
+def rotate_captures(max_captures: int = SLOW_TASK_MAX_CAPTURES):
+    """Remove as capturas de tarefas lentas mais antigas além de max_captures"""
+    captures = {}
+    for name in os.listdir(PROFILE_DIR):
+        if name.startswith("slow-"):
+            stem = name.rsplit(".", 1)[0]
+            path = os.path.join(PROFILE_DIR, name)
+            captures.setdefault(stem, []).append(path)
+
+    oldest_first = sorted(
+        captures,
+        key=lambda stem: (min(os.path.getmtime(p) for p in captures[stem]), stem),
+    )
+    for stem in oldest_first[: max(0, len(oldest_first) - max_captures)]:
+        for path in captures[stem]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def capture_slow_task(task_id: str, cnpj: str, trace: dict, total: float) -> bool:
+    """
+    Guarda em PROFILE_DIR o HTML bruto, os tempos e as estatísticas do
+    cProfile de uma tarefa cujo parse ou tempo total passou do limite.
+    No máximo uma tarefa a cada SLOW_TASK_MIN_INTERVAL segundos é capturada,
+    e só as SLOW_TASK_MAX_CAPTURES capturas mais recentes são mantidas.
+
+    O parse é determinístico, então as estatísticas vêm de um novo parse do
+    mesmo HTML sob o cProfile, sem custo de profiling nas tarefas normais.
+
+    Returns:
+        True se a tarefa foi capturada
+    """
+    parse = trace.get("parse_seconds", 0.0)
+    html = trace.get("html")
+    if parse < SLOW_TASK_PARSE_SECONDS and total < SLOW_TASK_TOTAL_SECONDS:
+        return False
+
+    global _last_capture
+    with _capture_lock:
+        now = time.monotonic()
+        if _last_capture is not None and now - _last_capture < SLOW_TASK_MIN_INTERVAL:
+            return False
+        _last_capture = now
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prefix = os.path.join(PROFILE_DIR, f"slow-{int(time.time())}-{task_id}")
+
+    timings = {
+        "task_id": task_id,
+        "cnpj": cnpj,
+        "total_seconds": total,
+        "upstream_seconds": trace.get("upstream_seconds"),
+        "parse_seconds": trace.get("parse_seconds"),
+    }
+    with open(f"{prefix}.json", "w") as f:
+        json.dump(timings, f)
+
+    if html is not None:
+        with open(f"{prefix}.html", "w", encoding="utf-8") as f:
+            f.write(html)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(parse_results_html, html)
+        except Exception:
+            pass
+        profiler.dump_stats(f"{prefix}.prof")
+
+    rotate_captures()
+    print(f"WORKER - Tarefa: {task_id} lenta ({total:.2f}s), capturada em {prefix}.*")
+    return True
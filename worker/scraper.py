@@ -1,11 +1,16 @@
 import re
+import time
 import unicodedata
 from collections import defaultdict
 
 import requests
 from bs4 import BeautifulSoup, Tag
 
-from worker.models import AtividadeEconomica, ScrapedCNPJ
+from worker.egress import BLOCK_STATUS_CODES, EgressPool, EgressRoute, get_egress_pool
+from worker.hedging import Hedger
+from worker.models import CNAE, AtividadeEconomica, ScrapedCNPJ
+
+SINTEGRA_URL = "https://appasp.sefaz.go.gov.br/sintegra/consulta/consultar.asp"
 
 NORMALIZE_KEY_EXCEPTIONS = {
     "operacoes com nf-e": "operacoes_com_nfe",
@@ -59,7 +64,8 @@ def parse_atividade_economica(
 ) -> AtividadeEconomica:
     """
     Recebe o elemento HTML que contém as Atividades Econômicas
-    e extrai as informações dos CNAE's para cada tipo de atividade
+    e extrai as informações dos CNAE's para cada tipo de atividade.
+    As descrições são internadas na tabela compartilhada de CNAE's.
 
     Args:
         atividadeEconomicaElement: Elemento HTML contendo as Atividades Econômicas
@@ -79,7 +85,9 @@ def parse_atividade_economica(
 
         cnae = conteudoElemento
         codigo_cnae, descricao_cane = map(str.strip, cnae.split(" - ", 1))
-        atividadesEconomicas[tipo_atividade].append({codigo_cnae: descricao_cane})
+        atividadesEconomicas[tipo_atividade].append(
+            CNAE(codigo=codigo_cnae, descricao=descricao_cane)
+        )
 
     return AtividadeEconomica.model_validate(atividadesEconomicas)
 
@@ -143,20 +151,37 @@ def parse_results_html(html_content: str) -> ScrapedCNPJ:
     return ScrapedCNPJ.model_validate(results)
 
 
-def perform_scraping(cnpj: str) -> ScrapedCNPJ:
+_hedger = None
+
+
+def get_hedger() -> Hedger:
+    """Hedger do processo, configurado pelas variáveis HEDGE_*"""
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
+
+
+def perform_scraping(
+    cnpj: str,
+    pool: EgressPool | None = None,
+    trace: dict | None = None,
+    hedger: Hedger | None = None,
+) -> ScrapedCNPJ:
     """
     Função que faz o scraping no site do Sintegra-GO.
 
     Args:
         cnpj: CNPJ a ser consultado
+        pool: Pool de rotas de saída; por padrão, o configurado em EGRESS_ROUTES
+        trace: Se informado, recebe o HTML bruto e os tempos de consulta e parse
+        hedger: Controle de requisições duplicadas; por padrão, o do processo
     Returns:
         Dicionário bonitinho com os dados extraídos do site
     """
     clean_cnpj = "".join(filter(str.isdigit, cnpj))
     formatted_cnpj = f"{clean_cnpj[:2]}.{clean_cnpj[2:5]}.{clean_cnpj[5:8]}/{clean_cnpj[8:12]}-{clean_cnpj[12:14]}"
 
-    url = "https://appasp.sefaz.go.gov.br/sintegra/consulta/consultar.asp"
-
     payload = {
         "rTipoDoc": "2",
         "tDoc": formatted_cnpj,
@@ -167,15 +192,59 @@ def perform_scraping(cnpj: str) -> ScrapedCNPJ:
         "Referer": "https://appasp.sefaz.go.gov.br/sintegra/consulta/default.html",
     }
 
-    print(f"SCRAPER - (CNPJ: {clean_cnpj}) Consultando Sintegra-GO...")
+    pool = pool or get_egress_pool()
+    hedger = hedger or get_hedger()
+
+    def send(route: EgressRoute) -> requests.Response:
+        print(
+            f"SCRAPER - (CNPJ: {clean_cnpj}) Consultando Sintegra-GO via {route.name}..."
+        )
+
+        attempt_started_at = time.monotonic()
+        try:
+            response = route.post(
+                SINTEGRA_URL, data=payload, headers=headers, timeout=30
+            )
+        except requests.exceptions.RequestException:
+            pool.report(route, error=True)
+            raise
+
+        latency = time.monotonic() - attempt_started_at
+        pool.report(
+            route,
+            latency=latency,
+            error=not response.ok,
+            blocked=response.status_code in BLOCK_STATUS_CODES,
+        )
+        if response.ok:
+            hedger.tracker.record(latency)
+        return response
+
+    def hedge() -> requests.Response:
+        # A tentativa extra não espera orçamento nem usa rotas em cooldown, e
+        # evita a rota já em uso
+        return send(pool.acquire(max_wait=0, avoid={first_route}, fallback=False))
 
     try:
-        response = requests.post(url, data=payload, headers=headers, timeout=30)
+        started_at = time.monotonic()
+        # A rota é reservada antes de o prazo do hedging começar a contar,
+        # para que a espera por orçamento não dispare a tentativa extra
+        first_route = pool.acquire()
+        response = hedger.call(lambda: send(first_route), hedge)
         response.raise_for_status()
 
         print(f"SCRAPER - (CNPJ: {clean_cnpj}) Resposta recebida. Parseando HTML...")
 
-        data = parse_results_html(response.text)
+        parse_started_at = time.monotonic()
+        if trace is not None:
+            trace["html"] = response.text
+            trace["upstream_seconds"] = parse_started_at - started_at
+
+        try:
+            data = parse_results_html(response.text)
+        finally:
+            if trace is not None:
+                trace["parse_seconds"] = time.monotonic() - parse_started_at
 
         return data
 
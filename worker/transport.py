@@ -0,0 +1,199 @@
+import json
+import os
+import socket
+import time
+from typing import Callable
+
+import pika
+import redis
+
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "rabbitmq")
+QUEUE_NAME = "scrape_tasks"
+
+STREAM_GROUP = "scrape_workers"
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+STREAM_BLOCK_MS = int(os.getenv("STREAM_BLOCK_MS", "5000"))
+# Precisa ser maior que o pior tempo de uma tarefa (espera por rota de saída,
+# consulta de até 30s e hedging), senão uma tarefa ainda em execução é
+# entregue a outro worker
+STREAM_CLAIM_IDLE_MS = int(os.getenv("STREAM_CLAIM_IDLE_MS", "300000"))
+STREAM_CLAIM_INTERVAL = float(os.getenv("STREAM_CLAIM_INTERVAL", "30"))
+
+# O handler recebe a mensagem já decodificada e retorna True se ela foi
+# aceita. Mensagens recusadas são descartadas, nunca reenfileiradas.
+MessageHandler = Callable[[dict], bool]
+
+
+class RabbitMQTransport:
+    """Transporte de tarefas sobre uma fila durável do RabbitMQ"""
+
+    def __init__(self, host: str = RABBITMQ_HOST, queue: str = QUEUE_NAME):
+        self.host = host
+        self.queue = queue
+        self.connection = None
+        self.channel = None
+
+    def connect(self):
+        """Estabelece a conexão com o servidor RabbitMQ com tentativas de reconexão"""
+        print("Tentando se conectar ao servidor do RabbitMQ...")
+        credentials = pika.PlainCredentials("user", "password")
+        parameters = pika.ConnectionParameters(host=self.host, credentials=credentials)
+        retry_interval = 3
+        for _ in range(10):
+            try:
+                self.connection = pika.BlockingConnection(parameters)
+                self.channel = self.connection.channel()
+                self.channel.queue_declare(queue=self.queue, durable=True)
+                self.channel.basic_qos(prefetch_count=1)
+                print("Conectado ao RabbitMQ com sucesso.")
+                return
+            except pika.exceptions.AMQPConnectionError:
+                print(
+                    f"Falha ao conectar ao RabbitMQ, tentando novamente em {retry_interval}"
+                )
+                time.sleep(retry_interval)
+        raise Exception("Não foi possível se conectar ao RabbitMQ.")
+
+    def publish(self, message: dict):
+        self.channel.basic_publish(
+            exchange="",
+            routing_key=self.queue,
+            body=json.dumps(message).encode(),
+            properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent),
+        )
+
+    def consume(self, handler: MessageHandler):
+        """Consome a fila até que stop() seja chamado"""
+
+        def callback(ch, method, properties, body):
+            try:
+                message = json.loads(body.decode())
+                accepted = handler(message)
+            except Exception as e:
+                print(f"WORKER - Erro ao tratar mensagem {body}: {e}")
+                accepted = False
+
+            if accepted:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            else:
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+        self.channel.basic_consume(queue=self.queue, on_message_callback=callback)
+        self.channel.start_consuming()
+
+    def stop(self):
+        self.channel.stop_consuming()
+
+    def close(self):
+        if self.connection and self.connection.is_open:
+            self.connection.close()
+        print("WORKER - Conexão com RabbitMQ fechada.")
+
+
+class RedisStreamsTransport:
+    """
+    Transporte de tarefas sobre um Redis Stream com consumer group.
+
+    Mensagens entregues a um worker que morreu antes do XACK ficam
+    pendentes no grupo; de tempos em tempos o consumidor as reivindica
+    via XAUTOCLAIM depois de STREAM_CLAIM_IDLE_MS sem confirmação.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        stream: str = QUEUE_NAME,
+        group: str = STREAM_GROUP,
+        consumer: str | None = None,
+    ):
+        self.redis = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.running = False
+
+    def connect(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            # BUSYGROUP: o grupo já foi criado por outro worker
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def publish(self, message: dict):
+        self.redis.xadd(
+            self.stream,
+            {"payload": json.dumps(message)},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    def _handle(self, handler: MessageHandler, message_id: str, fields: dict):
+        try:
+            message = json.loads(fields["payload"])
+            if not handler(message):
+                print(f"WORKER - Mensagem {message_id} descartada.")
+        except Exception as e:
+            print(f"WORKER - Erro ao tratar mensagem {message_id}: {e}")
+        finally:
+            self.redis.xack(self.stream, self.group, message_id)
+
+    def claim_stuck(self, handler: MessageHandler) -> int:
+        """Reprocessa mensagens pendentes de consumidores inativos"""
+        claimed = 0
+        start_id = "0-0"
+        while True:
+            response = self.redis.xautoclaim(
+                self.stream,
+                self.group,
+                self.consumer,
+                min_idle_time=STREAM_CLAIM_IDLE_MS,
+                start_id=start_id,
+                count=10,
+            )
+            start_id, messages = response[0], response[1]
+            for message_id, fields in messages:
+                # Entradas removidas pelo MAXLEN voltam com campos vazios
+                if fields:
+                    self._handle(handler, message_id, fields)
+                    claimed += 1
+            if start_id in ("0-0", b"0-0"):
+                return claimed
+
+    def consume(self, handler: MessageHandler):
+        """Consome o stream até que stop() seja chamado"""
+        self.running = True
+        last_claim = 0.0
+        while self.running:
+            if time.monotonic() - last_claim >= STREAM_CLAIM_INTERVAL:
+                claimed = self.claim_stuck(handler)
+                if claimed:
+                    print(f"WORKER - {claimed} mensagens pendentes reivindicadas.")
+                last_claim = time.monotonic()
+
+            response = self.redis.xreadgroup(
+                self.group,
+                self.consumer,
+                {self.stream: ">"},
+                count=1,
+                block=STREAM_BLOCK_MS,
+            )
+            for _, messages in response or []:
+                for message_id, fields in messages:
+                    self._handle(handler, message_id, fields)
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        print("WORKER - Consumo do Redis Stream encerrado.")
+
+
+def create_transport(backend: str, redis_client: redis.Redis):
+    """Instancia o transporte de fila configurado em QUEUE_BACKEND"""
+    if backend == "rabbitmq":
+        return RabbitMQTransport()
+    if backend == "redis":
+        return RedisStreamsTransport(redis_client)
+    raise ValueError(f"Backend de fila não suportado pelo worker: {backend}")